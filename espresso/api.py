@@ -0,0 +1,485 @@
+"""Python API to generate inputs, submit workflows and collect outputs within a single process"""
+
+from collections import namedtuple
+from json import load
+from os.path import abspath
+from threading import Lock
+
+import click
+
+from . import cromwell as cromwell
+from . import workflows as workflows
+from .references import collect_resources_files
+from .servers import load_submission
+from .workflows import WorkflowError
+
+WorkflowFiles = namedtuple('WorkflowFiles', [
+    'workflow', 'genome_version', 'destination', 'workflow_file', 'imports_file',
+    'inputs_file', 'options_file', 'labels_file'])
+WorkflowFiles.__doc__ = 'Files written into destination directory that are required to submit a workflow'
+
+Submission = namedtuple('Submission', ['files', 'host', 'workflow_id'])
+Submission.__doc__ = 'Workflow submitted to a Cromwell server'
+
+WorkflowResult = namedtuple('WorkflowResult', ['files', 'host', 'workflow_id', 'status', 'outputs'])
+WorkflowResult.__doc__ = 'Terminated workflow and list of output files collected into destination directory'
+
+__all__ = ['Pipeline', 'AsyncPipeline', 'WorkflowFiles', 'Submission', 'WorkflowResult', 'WorkflowError']
+
+
+class Pipeline:
+    """
+    Generates inputs, submits workflows to Cromwell and collects their outputs.
+    Resources files are validated once per workflow and shared by all runs of a pipeline.
+    Errors are raised as exceptions; a workflow that does not succeed raises WorkflowError
+    """
+
+    def __init__(self, host=None, reference=None, genome_version=None, sleep_time=5, move=False,
+                 call_caching=True, oom_retries=0, oom_max_mem_gb=None, delete_intermediates=False):
+        """
+        Creates a Pipeline
+        :param host: Cromwell server URL or list of Cromwell server URLs.
+        Each workflow is submitted to the server with fewer active workflows
+        :param reference: directory containing reference files
+        :param genome_version: reference genome version
+        :param sleep_time: time in seconds to sleep between workflow status check
+        :param move: Move output files to destination directory instead of copying them.
+        :param call_caching: read from and write to Cromwell call cache
+        :param oom_retries: maximum number of resubmissions after out of memory failures
+        :param oom_max_mem_gb: maximum memory in GB of a task after escalation
+        :param delete_intermediates: delete intermediate output files when each workflow succeeds
+        """
+        self.hosts = [host] if isinstance(host, str) else list(host or [])
+        if not self.hosts:
+            self.hosts = [workflows.DEFAULT_HOST]
+        self.reference = reference
+        self.genome_version = genome_version
+        self.sleep_time = sleep_time
+        self.move = move
+        self.call_caching = call_caching
+        self.oom_retries = oom_retries
+        self.oom_max_mem_gb = oom_max_mem_gb
+        self.delete_intermediates = delete_intermediates
+        self._resources = {}
+        self._resources_lock = Lock()
+        self._joint_plans = {}
+        self._joint_plans_lock = Lock()
+
+    def resources(self, workflow):
+        """
+        Collect and validate resources files of a workflow, only once per pipeline
+        :param workflow: workflow name
+        :return: dict containing resources inputs
+        """
+        with self._resources_lock:
+            if workflow not in self._resources.keys():
+                if workflow == 'haplotype-calling':
+                    resources = workflows.collect_haplotype_calling_resources(
+                        self.reference, self.genome_version)
+                else:
+                    resources = collect_resources_files(self.reference, workflow, self.genome_version)
+                self._resources[workflow] = resources
+            return dict(self._resources[workflow])
+
+    def joint_discovery_plan(self, targets=None, padding=100, sites_only_vcf=None):
+        """
+        Compute joint-discovery tuning parameters that do not depend on gVCF files, only once per pipeline
+        :param targets: BED or interval list file with target intervals (exome or targeted sequencing)
+        :param padding: number of bases added to both sides of each target
+        :param sites_only_vcf: sites-only VCF of a previous callset used to count SNP sites
+        :return: dict computed by workflows.plan_joint_discovery
+        """
+        key = (targets, padding, sites_only_vcf)
+        with self._joint_plans_lock:
+            if key not in self._joint_plans.keys():
+                self._joint_plans[key] = workflows.plan_joint_discovery(
+                    self.resources('joint-discovery'), targets, padding, sites_only_vcf)
+            return dict(self._joint_plans[key])
+
+    def haplotype_calling_inputs(self, directories, library_names, run_dates, platform_name,
+                                 sequencing_center, disable_platform_unit=False, **kwargs):
+        """
+        Create inputs for 'haplotype-calling' workflow
+        :param directories: list of directories containing paired-end FASTQ files
+        :param library_names: library name of each directory
+        :param run_dates: run date of each directory
+        :param platform_name: sequencing platform
+        :param sequencing_center: sequencing center
+        :param disable_platform_unit: disable extraction of platform unit from FASTQ header
+        :param kwargs: other arguments of workflows.haplotype_calling_inputs
+        :return: dict containing inputs data
+        """
+        return workflows.haplotype_calling_inputs(
+            directories=directories,
+            library_names=library_names,
+            platform_name=platform_name,
+            run_dates=run_dates,
+            sequencing_center=sequencing_center,
+            disable_platform_unit=disable_platform_unit,
+            reference=self.reference,
+            genome_version=self.genome_version,
+            resources=self.resources('haplotype-calling'),
+            **kwargs)
+
+    def joint_discovery_inputs(self, directories, callset_name, prefixes=None, **kwargs):
+        """
+        Create inputs for 'joint-discovery' workflow
+        :param directories: list of directories containing raw gVCF files
+        :param callset_name: callset name
+        :param prefixes: prefix added to sample names of each directory, defaults to no prefix
+        :param kwargs: other arguments of workflows.joint_discovery_inputs
+        :return: dict containing inputs data
+        """
+        if not prefixes:
+            prefixes = [''] * len(directories)
+        plan = self.joint_discovery_plan(
+            kwargs.get('targets'), kwargs.get('padding', 100), kwargs.get('sites_only_vcf'))
+        return workflows.joint_discovery_inputs(
+            directories, prefixes, self.reference, self.genome_version, callset_name,
+            resources=self.resources('joint-discovery'), plan=plan, **kwargs)
+
+    def prepare(self, workflow, inputs, destination, callset_name=None, batch=None):
+        """
+        Create destination directory and write workflow files into it
+        :param workflow: workflow name
+        :param inputs: dict containing inputs data
+        :param destination: directory to write all files
+        :param callset_name: callset name used to label the workflow
+        :param batch: batch name used to label the workflow, defaults to destination directory name
+        :return: WorkflowFiles
+        """
+        destination = abspath(destination)
+        return WorkflowFiles(workflow, self.genome_version, destination, *workflows.prepare_workflow(
+            workflow, self.genome_version, inputs, destination, callset_name, batch, self.call_caching,
+            self.delete_intermediates))
+
+    def find(self, workflow, destination):
+        """
+        Find workflow files previously written into destination, enabling call caching
+        :param workflow: workflow name
+        :param destination: directory containing workflow files of the previous run
+        :return: WorkflowFiles
+        """
+        destination = abspath(destination)
+        genome_version, *files = workflows.find_workflow_files(workflow, destination)
+        return WorkflowFiles(workflow, genome_version, destination, *files)
+
+    def submit(self, files):
+        """
+        Submit workflow to the least loaded Cromwell server without waiting for it.
+        Submission is recorded in destination directory
+        :param files: WorkflowFiles
+        :return: Submission
+        """
+        host, workflow_id = workflows.start_workflow(
+            self.hosts, files.workflow, files.genome_version, files.workflow_file, files.inputs_file,
+            files.imports_file, files.options_file, files.labels_file, files.destination)
+        return Submission(files, host, workflow_id)
+
+    def last_submission(self, files):
+        """
+        Last submission of a workflow recorded in destination directory
+        :param files: WorkflowFiles
+        :return: Submission or None if workflow was not submitted
+        """
+        record = load_submission(files.workflow, files.destination)
+        if record is None:
+            return None
+        return Submission(files, record['host'], record['workflow_id'])
+
+    def status(self, submission):
+        """
+        Retrieve current status of a submitted workflow
+        :param submission: Submission
+        :return: workflow status
+        """
+        return cromwell.status(submission.host, submission.workflow_id)
+
+    def abort(self, submission):
+        """
+        Abort a submitted workflow
+        :param submission: Submission
+        :return: workflow status
+        """
+        return cromwell.abort(submission.host, submission.workflow_id)
+
+    def collect(self, submission):
+        """
+        Copy (or move) output files of a succeeded workflow to destination
+        :param submission: Submission
+        :return: WorkflowResult
+        """
+        files = submission.files
+        workflow_id, outputs = workflows.finish_workflow(
+            submission.host, files.workflow, submission.workflow_id, 'Succeeded', files.destination, self.move)
+        return WorkflowResult(files, submission.host, workflow_id, 'Succeeded', outputs)
+
+    def run(self, files, report_cache_hits=None, submission=None):
+        """
+        Submit workflow; wait to complete resubmitting it after out of memory failures; and collect outputs
+        :param files: WorkflowFiles
+        :param report_cache_hits: report call cache hit ratio, defaults to whether call caching is enabled
+        :param submission: Submission of this workflow already submitted, waited for instead of submitting it
+        :return: WorkflowResult
+        :raise WorkflowError if workflow does not succeed
+        """
+        if report_cache_hits is None:
+            report_cache_hits = self.call_caching
+        host, workflow_id, outputs = workflows.run_workflow(
+            self.hosts, files.workflow, files.genome_version, files.workflow_file, files.inputs_file,
+            files.destination, files.imports_file, files.options_file, files.labels_file, self.sleep_time,
+            self.move, report_cache_hits, self.oom_retries, self.oom_max_mem_gb,
+            (submission.host, submission.workflow_id) if submission else None)
+        return WorkflowResult(files, host, workflow_id, 'Succeeded', outputs)
+
+    def run_variant_discovery(self, files, prepare_joint, report_cache_hits=None, plan_joint=None):
+        """
+        Run 'haplotype-calling' workflow and submit 'joint-discovery' workflow as soon as all samples are called.
+        gVCF files are staged into destination as each sample is called, so that joint-discovery does not wait
+        for BAM validation, CRAM conversion or collection of other haplotype-calling outputs.
+        If staging or submission fails, joint-discovery is submitted after haplotype-calling completes
+        :param files: WorkflowFiles of 'haplotype-calling' workflow
+        :param prepare_joint: function without arguments that returns WorkflowFiles of 'joint-discovery' workflow,
+        called once all gVCF files are staged
+        :param report_cache_hits: report call cache hit ratio, defaults to whether call caching is enabled
+        :param plan_joint: function without arguments called once the first gVCF file is staged, to compute
+        joint-discovery inputs that do not depend on gVCF files. Defaults to validating joint-discovery resources
+        :return: tuple containing WorkflowResult of both workflows
+        :raise WorkflowError if a workflow does not succeed
+        """
+        if report_cache_hits is None:
+            report_cache_hits = self.call_caching
+        with open(files.inputs_file) as file:
+            num_samples = len(load(file)['HaplotypeCalling.sample_name'])
+
+        staged_files = {}
+        gvcfs = []
+        joint = []
+        failed = []
+
+        def stage(host, workflow_id):
+            if joint or failed:
+                return
+            try:
+                new_gvcfs = workflows.stage_gvcfs(host, workflow_id, files.destination, staged_files)
+                if new_gvcfs and not gvcfs and plan_joint:
+                    # joint-discovery inputs not depending on gVCF files are computed while remaining samples are called
+                    plan_joint()
+                elif new_gvcfs and not gvcfs:
+                    self.resources('joint-discovery')
+                gvcfs.extend(new_gvcfs)
+                if len(gvcfs) < num_samples:
+                    return
+                click.echo('All {} gVCF files are staged, submitting joint-discovery workflow'.format(
+                    len(gvcfs)), err=True)
+                joint_files = prepare_joint()
+                joint.append(Submission(joint_files, *workflows.start_workflow(
+                    self.hosts, joint_files.workflow, joint_files.genome_version, joint_files.workflow_file,
+                    joint_files.inputs_file, joint_files.imports_file, joint_files.options_file,
+                    joint_files.labels_file, joint_files.destination)))
+            except Exception as e:
+                failed.append(e)
+                click.echo('Unable to submit joint-discovery workflow before haplotype-calling completes ({}), '
+                           'it will be submitted afterwards'.format(e), err=True)
+
+        try:
+            host, workflow_id, outputs = workflows.run_workflow(
+                self.hosts, files.workflow, files.genome_version, files.workflow_file, files.inputs_file,
+                files.destination, files.imports_file, files.options_file, files.labels_file, self.sleep_time,
+                self.move, report_cache_hits, self.oom_retries, self.oom_max_mem_gb,
+                on_poll=stage, staged_files=staged_files)
+        except WorkflowError:
+            if joint:
+                click.echo('Workflow joint-discovery ({}) is still running in {}'.format(
+                    joint[0].workflow_id, joint[0].host), err=True)
+            raise
+        haplotype_calling = WorkflowResult(files, host, workflow_id, 'Succeeded', outputs)
+
+        if joint:
+            return haplotype_calling, Pipeline.run(self, joint[0].files, report_cache_hits, joint[0])
+        return haplotype_calling, Pipeline.run(self, prepare_joint(), report_cache_hits)
+
+
+class AsyncPipeline(Pipeline):
+    """
+    Pipeline whose methods are coroutines so that many workflows are driven concurrently by one event loop.
+    Blocking work (file system and Cromwell requests) runs in an executor
+    """
+
+    def __init__(self, *args, executor=None, **kwargs):
+        """
+        Creates an AsyncPipeline
+        :param args: arguments of Pipeline
+        :param executor: concurrent.futures.Executor to run blocking work, defaults to event loop executor
+        :param kwargs: arguments of Pipeline
+        """
+        super().__init__(*args, **kwargs)
+        self.executor = executor
+
+    def _call(self, func, *args, **kwargs):
+        import asyncio
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self.executor, lambda: func(*args, **kwargs))
+
+    async def haplotype_calling_inputs(self, *args, **kwargs):
+        return await self._call(super().haplotype_calling_inputs, *args, **kwargs)
+
+    async def joint_discovery_inputs(self, *args, **kwargs):
+        return await self._call(super().joint_discovery_inputs, *args, **kwargs)
+
+    async def prepare(self, *args, **kwargs):
+        return await self._call(super().prepare, *args, **kwargs)
+
+    async def find(self, *args, **kwargs):
+        return await self._call(super().find, *args, **kwargs)
+
+    async def submit(self, files):
+        return await self._call(super().submit, files)
+
+    async def status(self, submission):
+        return await self._call(super().status, submission)
+
+    async def abort(self, submission):
+        return await self._call(super().abort, submission)
+
+    async def collect(self, submission):
+        return await self._call(super().collect, submission)
+
+    async def _call_back(self, func):
+        """
+        Call a function, in executor, or a coroutine function
+        :param func: function or coroutine function without arguments
+        :return: value returned by function
+        """
+        import asyncio
+        if asyncio.iscoroutinefunction(func):
+            return await func()
+        result = await self._call(func)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+    async def _wait(self, files, submission=None, on_poll=None):
+        """
+        Submit workflow and wait to terminate, resubmitting it after out of memory failures.
+        Cancelling the task aborts the workflow
+        :param files: WorkflowFiles
+        :param submission: Submission of this workflow already submitted, waited for instead of submitting it
+        :param on_poll: coroutine function called with Cromwell server URL and workflow ID after each status check
+        while the workflow is running and once it succeeds
+        :return: Submission and final workflow status
+        """
+        import asyncio
+        attempt = 0
+        while True:
+            if submission is None:
+                submission = await self.submit(files)
+            try:
+                while True:
+                    await asyncio.sleep(self.sleep_time)
+                    status = await self._call(workflows.check_workflow, submission.host, submission.workflow_id)
+                    if on_poll and status in [None, 'Succeeded']:
+                        await on_poll(submission.host, submission.workflow_id)
+                    if status is not None:
+                        break
+            except asyncio.CancelledError:
+                click.echo('Aborting workflow.', err=True)
+                await asyncio.shield(self._call(cromwell.abort, submission.host, submission.workflow_id))
+                raise
+
+            if status != 'Failed' or attempt >= self.oom_retries or not await self._call(
+                    workflows.retry_out_of_memory, submission.host, files.workflow, submission.workflow_id,
+                    files.inputs_file, files.destination, self.oom_max_mem_gb):
+                return submission, status
+
+            attempt += 1
+            click.echo('Resubmitting workflow ({}/{})'.format(attempt, self.oom_retries), err=True)
+            submission = None
+
+    async def run_variant_discovery(self, files, prepare_joint, report_cache_hits=None, plan_joint=None):
+        """
+        Run 'haplotype-calling' workflow and submit 'joint-discovery' workflow as soon as all samples are called.
+        Cancelling the task aborts both workflows
+        :param files: WorkflowFiles of 'haplotype-calling' workflow
+        :param prepare_joint: function or coroutine function without arguments that returns WorkflowFiles
+        of 'joint-discovery' workflow, called once all gVCF files are staged
+        :param report_cache_hits: report call cache hit ratio, defaults to whether call caching is enabled
+        :param plan_joint: function or coroutine function without arguments called once the first gVCF file is staged
+        :return: tuple containing WorkflowResult of both workflows
+        :raise WorkflowError if a workflow does not succeed
+        """
+        import asyncio
+        if report_cache_hits is None:
+            report_cache_hits = self.call_caching
+
+        def count_samples():
+            with open(files.inputs_file) as file:
+                return len(load(file)['HaplotypeCalling.sample_name'])
+        num_samples = await self._call(count_samples)
+
+        staged_files = {}
+        gvcfs = []
+        joint = []
+        failed = []
+
+        async def stage(host, workflow_id):
+            if joint or failed:
+                return
+            try:
+                new_gvcfs = await self._call(workflows.stage_gvcfs, host, workflow_id, files.destination, staged_files)
+                if new_gvcfs and not gvcfs and plan_joint:
+                    await self._call_back(plan_joint)
+                elif new_gvcfs and not gvcfs:
+                    await self._call(self.resources, 'joint-discovery')
+                gvcfs.extend(new_gvcfs)
+                if len(gvcfs) < num_samples:
+                    return
+                click.echo('All {} gVCF files are staged, submitting joint-discovery workflow'.format(
+                    len(gvcfs)), err=True)
+                joint.append(await self.submit(await self._call_back(prepare_joint)))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failed.append(e)
+                click.echo('Unable to submit joint-discovery workflow before haplotype-calling completes ({}), '
+                           'it will be submitted afterwards'.format(e), err=True)
+
+        try:
+            submission, status = await self._wait(files, on_poll=stage)
+            workflow_id, outputs = await self._call(
+                workflows.finish_workflow, submission.host, files.workflow, submission.workflow_id, status,
+                files.destination, self.move, report_cache_hits, staged_files)
+        except asyncio.CancelledError:
+            if joint:
+                click.echo('Aborting workflow joint-discovery.', err=True)
+                await asyncio.shield(self.abort(joint[0]))
+            raise
+        except WorkflowError:
+            if joint:
+                click.echo('Workflow joint-discovery ({}) is still running in {}'.format(
+                    joint[0].workflow_id, joint[0].host), err=True)
+            raise
+        haplotype_calling = WorkflowResult(files, submission.host, workflow_id, status, outputs)
+
+        if joint:
+            return haplotype_calling, await self.run(joint[0].files, report_cache_hits, joint[0])
+        return haplotype_calling, await self.run(await self._call_back(prepare_joint), report_cache_hits)
+
+    async def run(self, files, report_cache_hits=None, submission=None):
+        """
+        Submit workflow; wait to complete resubmitting it after out of memory failures; and collect outputs.
+        Cancelling the task aborts the workflow
+        :param files: WorkflowFiles
+        :param report_cache_hits: report call cache hit ratio, defaults to whether call caching is enabled
+        :param submission: Submission of this workflow already submitted, waited for instead of submitting it
+        :return: WorkflowResult
+        :raise WorkflowError if workflow does not succeed
+        """
+        if report_cache_hits is None:
+            report_cache_hits = self.call_caching
+
+        submission, status = await self._wait(files, submission)
+        workflow_id, outputs = await self._call(
+            workflows.finish_workflow, submission.host, files.workflow, submission.workflow_id, status,
+            files.destination, self.move, report_cache_hits)
+        return WorkflowResult(files, submission.host, workflow_id, status, outputs)
@@ -1,9 +1,26 @@
 """Cromwell client"""
 
 import re
+from threading import Lock
 from urllib.parse import urljoin
 
-import requests
+# HTTP session shared by all requests so that connections to Cromwell servers are reused
+_session = None
+_session_lock = Lock()
+
+
+def session():
+    """
+    Return HTTP session shared by all Cromwell requests.
+    requests is imported on first use to keep command line startup fast
+    :return: requests.Session
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            _session = requests.Session()
+    return _session
 
 
 def abort(host, workflow_id, api_version='v1'):
@@ -28,9 +45,7 @@ def status(host, workflow_id):
     :return:
     """
     url = '{host}/api/workflows/v1/{id}/status'.format(host=host, id=workflow_id)
-    r = requests.get(url)
-    r.raise_for_status()
-    return r.json().get('status')
+    return get(url).get('status')
 
 
 def submit(host, workflow, inputs=None, options=None, dependencies=None, labels=None, language=None,
@@ -86,15 +101,47 @@ def outputs(host, workflow_id, api_version='v1'):
     return response.get('outputs')
 
 
-def get(url, data=None, raw_response_content=False):
+def query(host, status=None, name=None, timeout=None, api_version='v1'):
+    """
+    Query workflows by status and name
+    :param host: Cromwell server URL
+    :param status: list of workflow statuses
+    :param name: workflow name
+    :param timeout: time in seconds to wait for server response
+    :param api_version: Cromwell API version
+    :return: dict containing results and totalResultsCount
+    """
+    path = '/api/workflows/{version}/query'.format(version=api_version)
+    params = dict(status=status, name=name)
+    return get(urljoin(host, path), params, timeout=timeout)
+
+
+def metadata(host, workflow_id, expand_sub_workflows=False, include_keys=None, api_version='v1'):
+    """
+    Get workflow and call-level metadata for a workflow
+    :param host: Cromwell server URL
+    :param workflow_id: Workflow ID
+    :param expand_sub_workflows: include metadata of sub-workflows
+    :param include_keys: list of metadata keys to return, all keys if None
+    :param api_version: Cromwell API version
+    :return: dict containing workflow metadata
+    """
+    path = '/api/workflows/{version}/{id}/metadata'.format(
+        id=workflow_id, version=api_version)
+    params = dict(expandSubWorkflows=str(expand_sub_workflows).lower(), includeKey=include_keys)
+    return get(urljoin(host, path), params)
+
+
+def get(url, data=None, raw_response_content=False, timeout=None):
     """
     GET API endpoint
     :param url: URL
     :param data: query parameters
     :param raw_response_content: return raw response content instead of parsing as JSON to dict
+    :param timeout: time in seconds to wait for server response
     :return: dic object or content of response in bytes
     """
-    response = requests.get(url, params=data)
+    response = session().get(url, params=data, timeout=timeout)
     response.raise_for_status()
     return response.content if raw_response_content else response.json()
 
@@ -107,7 +154,7 @@ def patch(url, data, raw_response_content=False):
     :param raw_response_content: return raw response content instead of parsing as JSON to dict
     :return: dic object or content of response in bytes
     """
-    response = requests.patch(url, data=data)
+    response = session().patch(url, data=data)
     response.raise_for_status()
     return response.content if raw_response_content else response.json()
 
@@ -120,7 +167,7 @@ def post(url, data=None, raw_response_content=False):
     :param raw_response_content: return raw response content instead of parsing as JSON to dict
     :return: dic object or content of response in bytes
     """
-    response = requests.post(url, files=data)
+    response = session().post(url, files=data)
     response.raise_for_status()
     return response.content if raw_response_content else response.json()
 
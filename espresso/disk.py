@@ -0,0 +1,231 @@
+"""Disk space estimation of workflows from the size of their input files"""
+
+from os import stat
+from os.path import getsize, exists, dirname, abspath
+from shutil import disk_usage
+
+import click
+
+from .vcf import collect_vcf_files
+
+GIB = 1024 ** 3
+
+# Size of files written by each haplotype-calling stage relative to compressed FASTQ size.
+# Stages marked as outputs are collected into destination directory
+HAPLOTYPE_CALLING_STAGES = [
+    ('PairedFastQsToUnmappedBAM', 1.0, False),
+    ('SamToFastqAndBwaMem', 1.3, False),
+    ('MergeBamAlignment', 1.4, False),
+    ('MarkDuplicates', 1.4, False),
+    ('SortAndFixTags', 1.4, False),
+    ('ApplyBQSR', 1.5, False),
+    ('GatherBamFiles', 1.5, True),
+    ('ConvertBamToCram', 0.6, True),
+    ('HaplotypeCaller', 0.1, False),
+    ('MergeGVCFs', 0.1, True)]
+
+# Direct alignment of FASTQ files replaces uBAM conversion, SamToFastqAndBwaMem and MergeBamAlignment
+DIRECT_ALIGNMENT_STAGES = [('BwaMemFromFastq', 1.3, False)]
+
+# ReblockGVCF writes a reblocked gVCF that replaces the merged gVCF as output
+REBLOCK_GVCF_STAGES = [('ReblockGVCF', 0.02, True)]
+
+# MarkDuplicatesSpark marks duplicates and sorts in a single pass, replacing MarkDuplicates and SortAndFixTags
+SPARK_MARK_DUPLICATES_STAGES = [('MarkDuplicatesSpark', 1.4, False)]
+
+# Size of files written by each joint-discovery stage relative to gVCF size
+JOINT_DISCOVERY_STAGES = [
+    ('ImportGVCFs', 1.5, False),
+    ('GenotypeGVCFs', 0.3, False),
+    ('HardFilterAndMakeSitesOnlyVcf', 0.3, False),
+    ('ApplyRecalibration', 0.3, False),
+    ('GatherVcfs', 0.3, True)]
+
+# Free space required above the estimates
+DISK_MARGIN = 1.1
+
+
+def files_size_gb(files):
+    """
+    Total size of files
+    :param files: list of file paths
+    :return: size in GB
+    """
+    return sum(getsize(file) for file in files) / GIB
+
+
+def plan_stages(stages, input_size_gb):
+    """
+    Estimate disk usage of workflow stages
+    :param stages: list of tuples containing stage name, size multiplier and whether it is an output
+    :param input_size_gb: size of input files in GB
+    :return: dict containing stages (list of stage name and size in GB), peak_gb and outputs_gb
+    """
+    sizes = [(stage, input_size_gb * factor) for stage, factor, is_output in stages]
+    return dict(stages=sizes,
+                peak_gb=sum(size for stage, size in sizes),
+                outputs_gb=sum(input_size_gb * factor for stage, factor, is_output in stages if is_output))
+
+
+def plan_haplotype_calling_disk(fastq_size_gb, spark_mark_duplicates=False, direct_alignment=False,
+                                reblock_gvcf=False):
+    """
+    Estimate disk usage of 'haplotype-calling' workflow.
+    Cromwell keeps files of all stages until the workflow ends, so peak usage is the sum of all stages
+    :param fastq_size_gb: size of compressed FASTQ files in GB
+    :param spark_mark_duplicates: duplicates are marked with MarkDuplicatesSpark
+    :param direct_alignment: FASTQ files are aligned directly, without uBAM
+    :param reblock_gvcf: merged gVCF files are reblocked
+    :return: dict containing workflow, stages, peak_gb, outputs_gb and gvcfs_gb
+    """
+    stages = HAPLOTYPE_CALLING_STAGES
+    if direct_alignment:
+        stages = DIRECT_ALIGNMENT_STAGES + [stage for stage in stages if stage[0] not in [
+            'PairedFastQsToUnmappedBAM', 'SamToFastqAndBwaMem', 'MergeBamAlignment']]
+    if spark_mark_duplicates:
+        idx = [stage[0] for stage in stages].index('MarkDuplicates')
+        stages = [stage for stage in stages if stage[0] not in ['MarkDuplicates', 'SortAndFixTags']]
+        stages[idx:idx] = SPARK_MARK_DUPLICATES_STAGES
+    if reblock_gvcf:
+        stages = [(name, factor, is_output and name != 'MergeGVCFs') for name, factor, is_output in stages]
+        stages += REBLOCK_GVCF_STAGES
+    plan = plan_stages(stages, fastq_size_gb)
+    plan['workflow'] = 'haplotype-calling'
+    gvcf_stage = 'ReblockGVCF' if reblock_gvcf else 'MergeGVCFs'
+    plan['gvcfs_gb'] = fastq_size_gb * dict((stage[0], stage[1]) for stage in stages)[gvcf_stage]
+    return plan
+
+
+def plan_joint_discovery_disk(gvcfs_size_gb):
+    """
+    Estimate disk usage of 'joint-discovery' workflow
+    :param gvcfs_size_gb: size of gVCF files in GB
+    :return: dict containing workflow, stages, peak_gb and outputs_gb
+    """
+    plan = plan_stages(JOINT_DISCOVERY_STAGES, gvcfs_size_gb)
+    plan['workflow'] = 'joint-discovery'
+    return plan
+
+
+def haplotype_calling_disk_plan(inputs):
+    """
+    Estimate disk usage of 'haplotype-calling' workflow from its inputs
+    :param inputs: dict containing inputs data
+    :return: dict containing workflow, stages, peak_gb, outputs_gb and gvcfs_gb
+    """
+    fastq_size_gb = files_size_gb(inputs['HaplotypeCalling.fastq_1'] + inputs['HaplotypeCalling.fastq_2'])
+    return plan_haplotype_calling_disk(
+        fastq_size_gb, inputs.get('HaplotypeCalling.spark_mark_duplicates', False),
+        'HaplotypeCalling.read_group' in inputs.keys(), inputs.get('HaplotypeCalling.reblock_gvcf', False))
+
+
+def joint_discovery_disk_plan(inputs, extra_gvcfs_size_gb=0):
+    """
+    Estimate disk usage of 'joint-discovery' workflow from its inputs
+    :param inputs: dict containing inputs data
+    :param extra_gvcfs_size_gb: size in GB of gVCF files not written yet, such as haplotype-calling outputs
+    :return: dict containing workflow, stages, peak_gb and outputs_gb
+    """
+    return plan_joint_discovery_disk(files_size_gb(inputs['JointGenotyping.input_gvcfs']) + extra_gvcfs_size_gb)
+
+
+def variant_discovery_disk_plans(inputs, vcf_directories=()):
+    """
+    Estimate disk usage of 'haplotype-calling' followed by 'joint-discovery' of its gVCFs
+    and of gVCF files of previous runs
+    :param inputs: dict containing inputs data of 'haplotype-calling' workflow
+    :param vcf_directories: list of directories containing raw gVCF files of previous runs
+    :return: list of disk plans, in execution order
+    """
+    haplotype_calling_plan = haplotype_calling_disk_plan(inputs)
+    gvcfs_size_gb = haplotype_calling_plan['gvcfs_gb']
+    for directory in vcf_directories:
+        gvcfs_size_gb += files_size_gb(collect_vcf_files(directory)[1])
+    return [haplotype_calling_plan, plan_joint_discovery_disk(gvcfs_size_gb)]
+
+
+def required_disk_space(plans, move=False, delete_intermediates=False):
+    """
+    Disk space required to run workflows one after another.
+    Intermediate files are kept in Cromwell execution directory unless they are deleted when each workflow succeeds;
+    output files are kept there too unless they are moved into destination directory
+    :param plans: list of disk plans, in execution order
+    :param move: output files are moved to destination directory instead of copied
+    :param delete_intermediates: intermediate files are deleted when workflow succeeds
+    :return: space in GB required in execution directory, in destination directory
+    and in both when they are in the same file system
+    """
+    scratch_gb = 0
+    combined_gb = 0
+    retained_gb = 0
+    destination_gb = 0
+    for plan in plans:
+        scratch_gb = max(scratch_gb, retained_gb + plan['peak_gb'])
+        copied_gb = 0 if move else plan['outputs_gb']
+        combined_gb = max(combined_gb, retained_gb + destination_gb + plan['peak_gb'] + copied_gb)
+        retained_gb += copied_gb
+        if not delete_intermediates:
+            retained_gb += plan['peak_gb'] - plan['outputs_gb']
+        destination_gb += plan['outputs_gb']
+    return scratch_gb, destination_gb, combined_gb
+
+
+def free_space_gb(path):
+    """
+    Free space of the file system where a path is (or would be) created
+    :param path: file or directory path
+    :return: tuple containing free space in GB and device ID
+    """
+    path = abspath(path)
+    while not exists(path):
+        path = dirname(path)
+    return disk_usage(path).free / GIB, stat(path).st_dev
+
+
+def check_disk_space(plans, destination, scratch=None, move=False, delete_intermediates=False, mode='warn'):
+    """
+    Report estimated disk usage of workflows and compare it with free space of
+    destination and Cromwell execution directories
+    :param plans: list of disk plans, in execution order
+    :param destination: destination directory
+    :param scratch: Cromwell execution directory, not checked if None
+    :param move: output files are moved to destination directory instead of copied
+    :param delete_intermediates: intermediate files are deleted when workflow succeeds
+    :param mode: 'warn' to print a warning, 'error' to raise an exception or 'off' to skip check
+    :return: True if there is enough free space
+    :raise Exception if there is not enough free space and mode is 'error'
+    """
+
+    if mode not in ['warn', 'error', 'off']:
+        raise Exception('Invalid disk check mode: ' + mode)
+    if mode == 'off':
+        return True
+
+    for plan in plans:
+        click.echo('Estimated disk usage of {}: peak {:.1f} GB, outputs {:.1f} GB'.format(
+            plan['workflow'], plan['peak_gb'], plan['outputs_gb']), err=True)
+        for stage, size_gb in plan['stages']:
+            click.echo('    {:<32} {:>10.1f} GB'.format(stage, size_gb), err=True)
+
+    scratch_gb, destination_gb, combined_gb = required_disk_space(plans, move, delete_intermediates)
+    free_gb, device = free_space_gb(destination)
+    requirements = [([destination], destination_gb, free_gb)]
+    if scratch:
+        scratch_free_gb, scratch_device = free_space_gb(scratch)
+        if scratch_device == device:
+            requirements = [([scratch, destination], combined_gb, free_gb)]
+        else:
+            requirements.append(([scratch], scratch_gb, scratch_free_gb))
+
+    enough = True
+    for paths, required_gb, free_gb in requirements:
+        required_gb *= DISK_MARGIN
+        if required_gb <= free_gb:
+            continue
+        enough = False
+        message = 'Not enough disk space in {}: {:.1f} GB required, {:.1f} GB free'.format(
+            ', '.join(paths), required_gb, free_gb)
+        if mode == 'error':
+            raise Exception(message)
+        click.echo('Warning: ' + message, err=True)
+    return enough
@@ -1,12 +1,9 @@
 """Espresso-Caller command line tool"""
 
-from os import mkdir
-from os.path import exists, abspath
+from os.path import abspath
 
 import click
 
-import espresso.workflows as workflows
-
 
 @click.group()
 def cli():
@@ -33,7 +30,10 @@ def cli():
 
 
 @cli.command('all')
-@click.option('--host', help='Cromwell server URL')
+@click.option('--host', 'hosts', multiple=True,
+              help='Cromwell server URL. Repeat to submit each workflow to the least loaded server')
+@click.option('--hosts_file', type=click.Path(exists=True, dir_okay=False),
+              help='File with Cromwell server URLs, one per line')
 @click.option('--fastq', 'fastq_directories', required=True, multiple=True, type=click.Path(exists=True),
               help='Path to directory containing paired-end FASTQ files')
 @click.option('--library', 'library_names', required=True, multiple=True,
@@ -60,6 +60,19 @@ def cli():
               help='Do not submit workflow to Cromwell. Just create destination directory and write JSON and WDL files')
 @click.option('--move', is_flag=True, default=False,
               help='Move output files to destination directory instead of copying them')
+@click.option('--batch', help='Batch name used to label workflows. Defaults to destination directory name')
+@click.option('--disable_call_caching', is_flag=True, default=False,
+              help='Do not read from or write to Cromwell call cache')
+@click.option('--delete_intermediates', is_flag=True, default=False,
+              help='Delete intermediate files from Cromwell execution directory when workflow succeeds')
+@click.option('--scratch', type=click.Path(exists=True, file_okay=False),
+              help='Cromwell execution directory, checked for free space before workflow is submitted')
+@click.option('--disk_check', default='warn', show_default=True, type=click.Choice(['warn', 'error', 'off']),
+              help='Warn about or refuse to submit workflows when estimated disk usage exceeds free space')
+@click.option('--oom_retries', default=2, type=click.INT, show_default=True,
+              help='Resubmit workflow with more memory for tasks that ran out of memory up to this number of times')
+@click.option('--oom_max_mem_gb', default=64, type=click.FLOAT, show_default=True,
+              help='Maximum memory (in GB) of a task after resubmissions due to lack of memory')
 @click.option('--gatk_path_override')
 @click.option('--gotc_path_override')
 @click.option('--samtools_path_override')
@@ -76,32 +89,85 @@ def cli():
 @click.option('--validate_bam_mem_gb', type=click.INT)
 @click.option('--indels_variant_recalibrator_mem_gb', 'indels_mem_gb', type=click.FLOAT)
 @click.option('--snps_variant_recalibrator_mem_gb', 'snps_mem_gb', type=click.FLOAT)
+@click.option('--available_cpu', type=click.INT,
+              help='CPUs available to run workflow tasks, used to choose number of HaplotypeCaller shards '
+                   'and to tune GenomicsDB import. Defaults to CPUs of this host')
+@click.option('--available_mem_gb', type=click.FLOAT,
+              help='Memory (in GB) available to run workflow tasks, used to tune GenomicsDB import and VQSR. '
+                   'Defaults to memory of this host')
+@click.option('--vqsr_mode', default='auto', show_default=True, type=click.Choice(['auto', 'classic', 'scattered']),
+              help='SNP VQSR mode. By default it is chosen by callset size and available memory')
+@click.option('--snps_model_mem_gb', type=click.FLOAT,
+              help='Memory (in GB) of scattered VQSR model creation. Defaults to estimated from SNP sites')
+@click.option('--snp_downsample_factor', type=click.INT,
+              help='Use one of every N SNP sites to build scattered VQSR model. Defaults to estimated from SNP sites')
+@click.option('--sites_only_vcf', type=click.Path(exists=True, dir_okay=False),
+              help='Sites-only VCF of a similar callset used to count SNP sites instead of estimating them from gVCFs')
+@click.option('--gatk_docker',
+              help='GATK docker image of joint-discovery workflow instead of broadinstitute/gatk:4.1.0.0. '
+                   'Required by reblocked gVCF files, use the image that wrote them')
 @click.option('--align_num_cpu', type=click.INT)
+@click.option('--align_chunks', type=click.INT,
+              help='Split reads of each sample into N chunks that are aligned in parallel')
+@click.option('--align_chunk_size_gb', type=click.FLOAT,
+              help='Split reads of each sample into chunks of this FASTQ size (in GB) that are aligned in parallel')
+@click.option('--spark_mark_duplicates', is_flag=True, default=False,
+              help='Mark duplicates and sort BAM files in a single pass with MarkDuplicatesSpark in local mode')
+@click.option('--mark_duplicates_num_cpu', type=click.INT,
+              help='Number of CPU cores used by MarkDuplicatesSpark')
+@click.option('--direct_fastq_alignment', is_flag=True, default=False,
+              help='Align FASTQ files directly with BWA, adding read group from sample metadata, '
+                   'instead of converting them to unmapped BAM')
+@click.option('--reblock_gvcf', is_flag=True, default=False,
+              help='Write reblocked gVCF files (.rb.g.vcf.gz) with hom-ref blocks merged into GQ bands '
+                   'instead of full-resolution gVCF files')
+@click.option('--reblock_gvcf_mem_gb', type=click.INT)
+@click.option('--hc_scatter', is_flag=True, default=False,
+              help='Generate HaplotypeCaller scatter from reference, splitting primary chromosomes at runs of N bases, '
+                   'instead of using its scattered calling intervals list')
+@click.option('--hc_shards', type=click.INT,
+              help='Number of HaplotypeCaller shards per sample of generated scatter. '
+                   'Defaults to available CPUs divided by number of samples')
+@click.option('--calling_regions', type=click.Path(exists=True, dir_okay=False),
+              help='BED or interval list file with regions to call, used to generate HaplotypeCaller scatter')
+@click.option('--targets', type=click.Path(exists=True, dir_okay=False),
+              help='BED or interval list file with target intervals of exome or targeted sequencing. '
+                   'Variant calling, BQSR and GenomicsDB import are restricted to padded targets')
+@click.option('--padding', default=100, type=click.INT, show_default=True,
+              help='Number of bases added to both sides of each target interval')
 @click.argument('callset_name')
 @click.argument('destination', type=click.Path())
 def variant_discovery(
-        host, fastq_directories, run_dates, library_names, platform_name,
+        hosts, hosts_file, fastq_directories, run_dates, library_names, platform_name,
         sequencing_center, disable_platform_unit, reference, genome_version,
-        vcf_directories, prefixes, sleep_time, move, gatk_path_override,
+        vcf_directories, prefixes, sleep_time, move, batch, disable_call_caching, delete_intermediates,
+        scratch, disk_check, oom_retries,
+        oom_max_mem_gb, gatk_path_override,
         gotc_path_override, samtools_path_override, bwa_commandline_override, fastq_bam_mem_gb,
         align_mem_gb, merge_bam_mem_gb, mark_duplicates_mem_gb,
         sort_mem_gb, baserecalibrator_mem_gb, aplly_bqsr_mem_gb, haplotype_caller_mem_gb,
-        indels_mem_gb, snps_mem_gb, dont_run, callset_name, align_num_cpu, merge_gvcfs_mem_gb,
-        validate_bam_mem_gb, destination):
+        indels_mem_gb, snps_mem_gb, available_cpu, available_mem_gb, vqsr_mode, snps_model_mem_gb,
+        snp_downsample_factor, sites_only_vcf, gatk_docker, dont_run, callset_name, align_num_cpu,
+        align_chunks, align_chunk_size_gb, spark_mark_duplicates, mark_duplicates_num_cpu,
+        direct_fastq_alignment, reblock_gvcf, reblock_gvcf_mem_gb, hc_scatter, hc_shards, calling_regions,
+        targets, padding, merge_gvcfs_mem_gb, validate_bam_mem_gb, destination):
     """Run haplotype-calling and JointGenotyping workflows"""
-    if not exists(destination):
-        mkdir(destination)
-    destination = abspath(destination)
+    import espresso.api as api
+    import espresso.disk as disk
+    import espresso.servers as servers
+    import espresso.vcf as vcf
+
+    pipeline = api.Pipeline(
+        servers.collect_hosts(hosts, hosts_file), reference, genome_version, sleep_time, move,
+        not disable_call_caching, oom_retries, oom_max_mem_gb, delete_intermediates)
 
-    inputs = workflows.haplotype_calling_inputs(
+    inputs = pipeline.haplotype_calling_inputs(
         directories=fastq_directories,
         library_names=library_names,
-        platform_name=platform_name,
         run_dates=run_dates,
+        platform_name=platform_name,
         sequencing_center=sequencing_center,
         disable_platform_unit=disable_platform_unit,
-        reference=reference,
-        genome_version=genome_version,
         gatk_path_override=gatk_path_override,
         gotc_path_override=gotc_path_override,
         samtools_path_override=samtools_path_override,
@@ -116,28 +182,67 @@ def variant_discovery(
         haplotype_caller_mem_gb=haplotype_caller_mem_gb,
         merge_gvcfs_mem_gb=merge_gvcfs_mem_gb,
         validate_bam_mem_gb=validate_bam_mem_gb,
-        align_num_cpu=align_num_cpu)
+        align_num_cpu=align_num_cpu,
+        align_chunks=align_chunks,
+        align_chunk_size_gb=align_chunk_size_gb,
+        spark_mark_duplicates=spark_mark_duplicates,
+        mark_duplicates_num_cpu=mark_duplicates_num_cpu,
+        direct_fastq_alignment=direct_fastq_alignment,
+        reblock_gvcf=reblock_gvcf,
+        reblock_gvcf_mem_gb=reblock_gvcf_mem_gb,
+        hc_scatter=hc_scatter,
+        hc_shards=hc_shards,
+        calling_regions=calling_regions,
+        available_cpu=available_cpu,
+        targets=targets,
+        padding=padding)
 
-    workflows.submit_workflow(
-        host, 'haplotype-calling', genome_version, inputs, destination,
-        sleep_time, dont_run, move)
+    files = pipeline.prepare('haplotype-calling', inputs, destination, callset_name, batch)
+    disk.check_disk_space(
+        disk.variant_discovery_disk_plans(inputs, vcf_directories), files.destination, scratch, move,
+        delete_intermediates, disk_check)
+    if dont_run:
+        click.echo('Workflow will not be submitted to Cromwell. See workflow files in ' + files.destination)
+        return
 
     vcf_directories = list(vcf_directories)
-    vcf_directories.append(destination)
+    vcf_directories.append(files.destination)
 
     prefixes = list(prefixes)
     prefixes.append('')
 
-    inputs = workflows.joint_discovery_inputs(
-        vcf_directories, prefixes, reference, genome_version, callset_name,
-        gatk_path_override, indels_mem_gb, snps_mem_gb)
-    workflows.submit_workflow(
-        host, 'joint-discovery', genome_version, inputs, destination,
-        sleep_time, dont_run, move)
+    # reblocked gVCF files are genotyped by the GATK docker image that wrote them
+    if reblock_gvcf and not gatk_docker:
+        gatk_docker = inputs.get('HaplotypeCalling.gatk_docker_override') or vcf.HC_GATK_DOCKER
+
+    def prepare_joint():
+        joint_inputs = pipeline.joint_discovery_inputs(
+            vcf_directories, callset_name, prefixes,
+            gatk_path_override=gatk_path_override,
+            indels_mem_gb=indels_mem_gb,
+            snps_mem_gb=snps_mem_gb,
+            available_cpu=available_cpu,
+            available_mem_gb=available_mem_gb,
+            vqsr_mode=vqsr_mode,
+            snps_model_mem_gb=snps_model_mem_gb,
+            snp_downsample_factor=snp_downsample_factor,
+            sites_only_vcf=sites_only_vcf,
+            targets=targets,
+            padding=padding,
+            gatk_docker=gatk_docker)
+        return pipeline.prepare('joint-discovery', joint_inputs, destination, callset_name, batch)
+
+    def plan_joint():
+        pipeline.joint_discovery_plan(targets=targets, padding=padding, sites_only_vcf=sites_only_vcf)
+
+    pipeline.run_variant_discovery(files, prepare_joint, plan_joint=plan_joint)
 
 
 @cli.command('hc')
-@click.option('--host', help='Cromwell server URL')
+@click.option('--host', 'hosts', multiple=True,
+              help='Cromwell server URL. Repeat to submit each workflow to the least loaded server')
+@click.option('--hosts_file', type=click.Path(exists=True, dir_okay=False),
+              help='File with Cromwell server URLs, one per line')
 @click.option('--fastq', 'directories', required=True, multiple=True, type=click.Path(exists=True),
               help='Path to directory containing paired-end FASTQ files')
 @click.option('--library', 'library_names', required=True, multiple=True,
@@ -160,6 +265,19 @@ def variant_discovery(
               help='Time to sleep (in seconds) between each workflow status check')
 @click.option('--move', is_flag=True, default=False,
               help='Move output files to destination directory instead of copying them')
+@click.option('--batch', help='Batch name used to label workflows. Defaults to destination directory name')
+@click.option('--disable_call_caching', is_flag=True, default=False,
+              help='Do not read from or write to Cromwell call cache')
+@click.option('--delete_intermediates', is_flag=True, default=False,
+              help='Delete intermediate files from Cromwell execution directory when workflow succeeds')
+@click.option('--scratch', type=click.Path(exists=True, file_okay=False),
+              help='Cromwell execution directory, checked for free space before workflow is submitted')
+@click.option('--disk_check', default='warn', show_default=True, type=click.Choice(['warn', 'error', 'off']),
+              help='Warn about or refuse to submit workflows when estimated disk usage exceeds free space')
+@click.option('--oom_retries', default=2, type=click.INT, show_default=True,
+              help='Resubmit workflow with more memory for tasks that ran out of memory up to this number of times')
+@click.option('--oom_max_mem_gb', default=64, type=click.FLOAT, show_default=True,
+              help='Maximum memory (in GB) of a task after resubmissions due to lack of memory')
 @click.option('--gatk_path_override')
 @click.option('--gotc_path_override')
 @click.option('--samtools_path_override')
@@ -175,29 +293,66 @@ def variant_discovery(
 @click.option('--merge_gvcfs_mem_gb', type=click.INT)
 @click.option('--validate_bam_mem_gb', type=click.INT)
 @click.option('--align_num_cpu', type=click.INT)
+@click.option('--align_chunks', type=click.INT,
+              help='Split reads of each sample into N chunks that are aligned in parallel')
+@click.option('--align_chunk_size_gb', type=click.FLOAT,
+              help='Split reads of each sample into chunks of this FASTQ size (in GB) that are aligned in parallel')
+@click.option('--spark_mark_duplicates', is_flag=True, default=False,
+              help='Mark duplicates and sort BAM files in a single pass with MarkDuplicatesSpark in local mode')
+@click.option('--mark_duplicates_num_cpu', type=click.INT,
+              help='Number of CPU cores used by MarkDuplicatesSpark')
+@click.option('--direct_fastq_alignment', is_flag=True, default=False,
+              help='Align FASTQ files directly with BWA, adding read group from sample metadata, '
+                   'instead of converting them to unmapped BAM')
+@click.option('--reblock_gvcf', is_flag=True, default=False,
+              help='Write reblocked gVCF files (.rb.g.vcf.gz) with hom-ref blocks merged into GQ bands '
+                   'instead of full-resolution gVCF files')
+@click.option('--reblock_gvcf_mem_gb', type=click.INT)
+@click.option('--hc_scatter', is_flag=True, default=False,
+              help='Generate HaplotypeCaller scatter from reference, splitting primary chromosomes at runs of N bases, '
+                   'instead of using its scattered calling intervals list')
+@click.option('--hc_shards', type=click.INT,
+              help='Number of HaplotypeCaller shards per sample of generated scatter. '
+                   'Defaults to available CPUs divided by number of samples')
+@click.option('--calling_regions', type=click.Path(exists=True, dir_okay=False),
+              help='BED or interval list file with regions to call, used to generate HaplotypeCaller scatter')
+@click.option('--available_cpu', type=click.INT,
+              help='CPUs available to run workflow tasks, used to choose number of HaplotypeCaller shards. '
+                   'Defaults to CPUs of this host')
+@click.option('--targets', type=click.Path(exists=True, dir_okay=False),
+              help='BED or interval list file with target intervals of exome or targeted sequencing. '
+                   'Variant calling, BQSR and GenomicsDB import are restricted to padded targets')
+@click.option('--padding', default=100, type=click.INT, show_default=True,
+              help='Number of bases added to both sides of each target interval')
 @click.argument('destination', type=click.Path())
 def haplotype_calling(
-        host, directories, library_names, run_dates, platform_name,
+        hosts, hosts_file, directories, library_names, run_dates, platform_name,
         sequencing_center, disable_platform_unit, reference, genome_version,
-        dont_run, sleep_time, move, gatk_path_override, gotc_path_override,
+        dont_run, sleep_time, move, batch, disable_call_caching, delete_intermediates, scratch, disk_check,
+        oom_retries, oom_max_mem_gb,
+        gatk_path_override, gotc_path_override,
         samtools_path_override, bwa_commandline_override, fastq_bam_mem_gb, align_mem_gb,
         merge_bam_mem_gb, mark_duplicates_mem_gb, sort_mem_gb,
         baserecalibrator_mem_gb, aplly_bqsr_mem_gb, haplotype_caller_mem_gb, merge_gvcfs_mem_gb,
-        validate_bam_mem_gb, align_num_cpu, destination):
+        validate_bam_mem_gb, align_num_cpu, align_chunks, align_chunk_size_gb, spark_mark_duplicates,
+        mark_duplicates_num_cpu, direct_fastq_alignment, reblock_gvcf, reblock_gvcf_mem_gb, hc_scatter, hc_shards,
+        calling_regions, available_cpu, targets, padding, destination):
     """Run only haplotype-calling workflow"""
-    if not exists(destination):
-        mkdir(destination)
-    destination = abspath(destination)
+    import espresso.api as api
+    import espresso.disk as disk
+    import espresso.servers as servers
+
+    pipeline = api.Pipeline(
+        servers.collect_hosts(hosts, hosts_file), reference, genome_version, sleep_time, move,
+        not disable_call_caching, oom_retries, oom_max_mem_gb, delete_intermediates)
 
-    inputs = workflows.haplotype_calling_inputs(
+    inputs = pipeline.haplotype_calling_inputs(
         directories=directories,
         library_names=library_names,
-        platform_name=platform_name,
         run_dates=run_dates,
+        platform_name=platform_name,
         sequencing_center=sequencing_center,
         disable_platform_unit=disable_platform_unit,
-        reference=reference,
-        genome_version=genome_version,
         gatk_path_override=gatk_path_override,
         gotc_path_override=gotc_path_override,
         samtools_path_override=samtools_path_override,
@@ -212,15 +367,36 @@ def haplotype_calling(
         haplotype_caller_mem_gb=haplotype_caller_mem_gb,
         merge_gvcfs_mem_gb=merge_gvcfs_mem_gb,
         validate_bam_mem_gb=validate_bam_mem_gb,
-        align_num_cpu=align_num_cpu)
+        align_num_cpu=align_num_cpu,
+        align_chunks=align_chunks,
+        align_chunk_size_gb=align_chunk_size_gb,
+        spark_mark_duplicates=spark_mark_duplicates,
+        mark_duplicates_num_cpu=mark_duplicates_num_cpu,
+        direct_fastq_alignment=direct_fastq_alignment,
+        reblock_gvcf=reblock_gvcf,
+        reblock_gvcf_mem_gb=reblock_gvcf_mem_gb,
+        hc_scatter=hc_scatter,
+        hc_shards=hc_shards,
+        calling_regions=calling_regions,
+        available_cpu=available_cpu,
+        targets=targets,
+        padding=padding)
 
-    workflows.submit_workflow(
-        host, 'haplotype-calling', genome_version, inputs,
-        abspath(destination), sleep_time, dont_run, move)
+    files = pipeline.prepare('haplotype-calling', inputs, destination, batch=batch)
+    disk.check_disk_space(
+        [disk.haplotype_calling_disk_plan(inputs)], files.destination, scratch, move, delete_intermediates,
+        disk_check)
+    if dont_run:
+        click.echo('Workflow will not be submitted to Cromwell. See workflow files in ' + files.destination)
+        return
+    pipeline.run(files)
 
 
 @cli.command('joint')
-@click.option('--host', help='Cromwell server URL')
+@click.option('--host', 'hosts', multiple=True,
+              help='Cromwell server URL. Repeat to submit each workflow to the least loaded server')
+@click.option('--hosts_file', type=click.Path(exists=True, dir_okay=False),
+              help='File with Cromwell server URLs, one per line')
 @click.option('--vcf', 'directories', required=True, multiple=True, type=click.Path(exists=True),
               help='Path to directory containing raw gVCF and their index files')
 @click.option('--prefix', 'prefixes', multiple=True,
@@ -235,23 +411,267 @@ def haplotype_calling(
               help='Time to sleep (in seconds) between each workflow status check')
 @click.option('--move', is_flag=True, default=False,
               help='Move output files to destination directory instead of copying them')
+@click.option('--batch', help='Batch name used to label workflows. Defaults to destination directory name')
+@click.option('--disable_call_caching', is_flag=True, default=False,
+              help='Do not read from or write to Cromwell call cache')
+@click.option('--delete_intermediates', is_flag=True, default=False,
+              help='Delete intermediate files from Cromwell execution directory when workflow succeeds')
+@click.option('--scratch', type=click.Path(exists=True, file_okay=False),
+              help='Cromwell execution directory, checked for free space before workflow is submitted')
+@click.option('--disk_check', default='warn', show_default=True, type=click.Choice(['warn', 'error', 'off']),
+              help='Warn about or refuse to submit workflows when estimated disk usage exceeds free space')
+@click.option('--oom_retries', default=2, type=click.INT, show_default=True,
+              help='Resubmit workflow with more memory for tasks that ran out of memory up to this number of times')
+@click.option('--oom_max_mem_gb', default=64, type=click.FLOAT, show_default=True,
+              help='Maximum memory (in GB) of a task after resubmissions due to lack of memory')
 @click.option('--gatk_path_override')
 @click.option('--indels_variant_recalibrator_mem_gb', 'indels_mem_gb', type=click.FLOAT)
 @click.option('--snps_variant_recalibrator_mem_gb', 'snps_mem_gb', type=click.FLOAT)
+@click.option('--available_cpu', type=click.INT,
+              help='CPUs available to run workflow tasks, used to tune GenomicsDB import. Defaults to CPUs of this host')
+@click.option('--available_mem_gb', type=click.FLOAT,
+              help='Memory (in GB) available to run workflow tasks, used to tune GenomicsDB import and VQSR. '
+                   'Defaults to memory of this host')
+@click.option('--vqsr_mode', default='auto', show_default=True, type=click.Choice(['auto', 'classic', 'scattered']),
+              help='SNP VQSR mode. By default it is chosen by callset size and available memory')
+@click.option('--snps_model_mem_gb', type=click.FLOAT,
+              help='Memory (in GB) of scattered VQSR model creation. Defaults to estimated from SNP sites')
+@click.option('--snp_downsample_factor', type=click.INT,
+              help='Use one of every N SNP sites to build scattered VQSR model. Defaults to estimated from SNP sites')
+@click.option('--sites_only_vcf', type=click.Path(exists=True, dir_okay=False),
+              help='Sites-only VCF of a similar callset used to count SNP sites instead of estimating them from gVCFs')
+@click.option('--gatk_docker',
+              help='GATK docker image of joint-discovery workflow instead of broadinstitute/gatk:4.1.0.0. '
+                   'Required by reblocked gVCF files, use the image that wrote them')
+@click.option('--targets', type=click.Path(exists=True, dir_okay=False),
+              help='BED or interval list file with target intervals of exome or targeted sequencing. '
+                   'Variant calling, BQSR and GenomicsDB import are restricted to padded targets')
+@click.option('--padding', default=100, type=click.INT, show_default=True,
+              help='Number of bases added to both sides of each target interval')
 @click.argument('callset_name')
 @click.argument('destination', type=click.Path())
 def joint_genotyping(
-        host, directories, prefixes, reference, genome_version, dont_run,
-        sleep_time, move, gatk_path_override, indels_mem_gb, snps_mem_gb,
-        callset_name, destination):
+        hosts, hosts_file, directories, prefixes, reference, genome_version, dont_run,
+        sleep_time, move, batch, disable_call_caching, delete_intermediates, scratch, disk_check,
+        oom_retries, oom_max_mem_gb,
+        gatk_path_override, indels_mem_gb,
+        snps_mem_gb, available_cpu, available_mem_gb, vqsr_mode, snps_model_mem_gb, snp_downsample_factor,
+        sites_only_vcf, gatk_docker, targets, padding, callset_name, destination):
     """Run only JointGenotyping-gatk4 workflow"""
-    if not exists(destination):
-        mkdir(destination)
-    destination = abspath(destination)
-
-    inputs = workflows.joint_discovery_inputs(
-        directories, prefixes, reference, genome_version, callset_name,
-        gatk_path_override, indels_mem_gb, snps_mem_gb)
-    workflows.submit_workflow(
-        host, 'joint-discovery', genome_version, inputs, destination,
-        sleep_time, dont_run, move)
+    import espresso.api as api
+    import espresso.disk as disk
+    import espresso.servers as servers
+
+    pipeline = api.Pipeline(
+        servers.collect_hosts(hosts, hosts_file), reference, genome_version, sleep_time, move,
+        not disable_call_caching, oom_retries, oom_max_mem_gb, delete_intermediates)
+
+    inputs = pipeline.joint_discovery_inputs(
+        directories, callset_name, prefixes,
+        gatk_path_override=gatk_path_override,
+        indels_mem_gb=indels_mem_gb,
+        snps_mem_gb=snps_mem_gb,
+        available_cpu=available_cpu,
+        available_mem_gb=available_mem_gb,
+        vqsr_mode=vqsr_mode,
+        snps_model_mem_gb=snps_model_mem_gb,
+        snp_downsample_factor=snp_downsample_factor,
+        sites_only_vcf=sites_only_vcf,
+        targets=targets,
+        padding=padding,
+        gatk_docker=gatk_docker)
+
+    files = pipeline.prepare('joint-discovery', inputs, destination, callset_name, batch)
+    disk.check_disk_space(
+        [disk.joint_discovery_disk_plan(inputs)], files.destination, scratch, move, delete_intermediates,
+        disk_check)
+    if dont_run:
+        click.echo('Workflow will not be submitted to Cromwell. See workflow files in ' + files.destination)
+        return
+    pipeline.run(files)
+
+
+@cli.command('resume')
+@click.option('--host', 'hosts', multiple=True,
+              help='Cromwell server URL. Repeat to submit each workflow to the least loaded server')
+@click.option('--hosts_file', type=click.Path(exists=True, dir_okay=False),
+              help='File with Cromwell server URLs, one per line')
+@click.option('--sleep', 'sleep_time', default=300, type=click.INT,
+              help='Time to sleep (in seconds) between each workflow status check')
+@click.option('--move', is_flag=True, default=False,
+              help='Move output files to destination directory instead of copying them')
+@click.option('--oom_retries', default=2, type=click.INT, show_default=True,
+              help='Resubmit workflow with more memory for tasks that ran out of memory up to this number of times')
+@click.option('--oom_max_mem_gb', default=64, type=click.FLOAT, show_default=True,
+              help='Maximum memory (in GB) of a task after resubmissions due to lack of memory')
+@click.argument('workflow', type=click.Choice(['haplotype-calling', 'joint-discovery']))
+@click.argument('destination', type=click.Path(exists=True, file_okay=False))
+def resume(hosts, hosts_file, sleep_time, move, oom_retries, oom_max_mem_gb, workflow, destination):
+    """Resubmit a failed workflow reusing results from Cromwell call cache"""
+    import espresso.api as api
+    import espresso.servers as servers
+
+    pipeline = api.Pipeline(
+        servers.collect_hosts(hosts, hosts_file), sleep_time=sleep_time, move=move, oom_retries=oom_retries,
+        oom_max_mem_gb=oom_max_mem_gb)
+    pipeline.run(pipeline.find(workflow, destination), report_cache_hits=True)
+
+
+@cli.command('status')
+@click.argument('workflow', type=click.Choice(['haplotype-calling', 'joint-discovery']))
+@click.argument('destination', type=click.Path(exists=True, file_okay=False))
+def status(workflow, destination):
+    """Show status of the last workflow submitted with destination directory"""
+    import espresso.cromwell as cromwell
+
+    submission = load_last_submission(workflow, destination)
+    click.echo('{}\t{}\t{}'.format(
+        submission['host'], submission['workflow_id'],
+        cromwell.status(submission['host'], submission['workflow_id'])))
+
+
+@cli.command('abort')
+@click.argument('workflow', type=click.Choice(['haplotype-calling', 'joint-discovery']))
+@click.argument('destination', type=click.Path(exists=True, file_okay=False))
+def abort(workflow, destination):
+    """Abort the last workflow submitted with destination directory"""
+    import espresso.cromwell as cromwell
+
+    submission = load_last_submission(workflow, destination)
+    click.echo('{}\t{}\t{}'.format(
+        submission['host'], submission['workflow_id'],
+        cromwell.abort(submission['host'], submission['workflow_id'])))
+
+
+def load_last_submission(workflow, destination):
+    """
+    Load last submission of a workflow recorded in destination directory
+    :param workflow: workflow name
+    :param destination: destination directory
+    :return: dict containing workflow, host, workflow_id and submitted
+    """
+    import espresso.servers as servers
+
+    submission = servers.load_submission(workflow, abspath(destination))
+    if submission is None:
+        raise click.ClickException('Submission of {} not found in {}'.format(workflow, destination))
+    return submission
+
+
+@cli.command('ingest')
+@click.option('--host', 'hosts', multiple=True,
+              help='Cromwell server URL. Repeat to submit each workflow to the least loaded server')
+@click.option('--hosts_file', type=click.Path(exists=True, dir_okay=False),
+              help='File with Cromwell server URLs, one per line')
+@click.option('--landing', 'landing_directories', required=True, multiple=True,
+              type=click.Path(exists=True, file_okay=False),
+              help='Path to directory where sequencing run directories are written')
+@click.option('--marker', required=True,
+              help='File name (relative to run directory) written when FASTQ conversion of a run is complete, '
+                   'e.g. Logs/FastqComplete.txt of BCL Convert output. '
+                   'RTAComplete.txt only indicates that BCL transfer is complete')
+@click.option('--sample_sheet', default='SampleSheet.csv', show_default=True,
+              help='Sample sheet file name inside run directory. Library name and run date are read from its header')
+@click.option('--name_regex',
+              help='Regex with "library" and "date" groups to extract metadata from run directory name. '
+                   'Defaults to Illumina run folder name: YYMMDD_INSTRUMENT_RUN_FLOWCELL')
+@click.option('--fastq_subdir', default='',
+              help='Path to directory containing paired-end FASTQ files relative to run directory')
+@click.option('--platform', 'platform_name', required=True,
+              help='Name of the sequencing platform')
+@click.option('--center', 'sequencing_center', required=True,
+              help='Sequencing center name')
+@click.option('--disable_platform_unit', is_flag=True, default=False,
+              help='Disable extraction of platform unit (PU) from FASTQ header')
+@click.option('--reference', required=True, type=click.Path(exists=True),
+              help='Path to directory containing reference files')
+@click.option('--version', 'genome_version', required=True, type=click.Choice(['hg38', 'b37']),
+              help='Version of reference files')
+@click.option('--poll', 'poll_time', default=60, type=click.INT, show_default=True,
+              help='Time to sleep (in seconds) between each scan of landing directories')
+@click.option('--max_concurrent', default=1, type=click.INT, show_default=True,
+              help='Maximum number of runs processed at the same time')
+@click.option('--retry_failed', default=3, type=click.INT, show_default=True,
+              help='Maximum number of times a failed run is processed again')
+@click.option('--retry_delay', default=600, type=click.INT, show_default=True,
+              help='Time (in seconds) to wait before retrying a failed run, doubled after each failure')
+@click.option('--once', is_flag=True, default=False,
+              help='Process completed runs found in landing directories and exit')
+@click.option('--sleep', 'sleep_time', default=300, type=click.INT,
+              help='Time to sleep (in seconds) between each workflow status check')
+@click.option('--move', is_flag=True, default=False,
+              help='Move output files to destination directory instead of copying them')
+@click.option('--oom_retries', default=2, type=click.INT, show_default=True,
+              help='Resubmit workflow with more memory for tasks that ran out of memory up to this number of times')
+@click.option('--oom_max_mem_gb', default=64, type=click.FLOAT, show_default=True,
+              help='Maximum memory (in GB) of a task after resubmissions due to lack of memory')
+@click.option('--delete_intermediates', is_flag=True, default=False,
+              help='Delete intermediate files from Cromwell execution directory when each workflow succeeds')
+@click.option('--gatk_path_override')
+@click.option('--gotc_path_override')
+@click.option('--samtools_path_override')
+@click.option('--bwa_commandline_override')
+@click.option('--align_num_cpu', type=click.INT)
+@click.option('--direct_fastq_alignment', is_flag=True, default=False,
+              help='Align FASTQ files directly with BWA, adding read group from sample metadata, '
+                   'instead of converting them to unmapped BAM')
+@click.option('--reblock_gvcf', is_flag=True, default=False,
+              help='Write reblocked gVCF files (.rb.g.vcf.gz) with hom-ref blocks merged into GQ bands '
+                   'instead of full-resolution gVCF files')
+@click.option('--reblock_gvcf_mem_gb', type=click.INT)
+@click.option('--hc_scatter', is_flag=True, default=False,
+              help='Generate HaplotypeCaller scatter from reference, splitting primary chromosomes at runs of N bases, '
+                   'instead of using its scattered calling intervals list')
+@click.option('--hc_shards', type=click.INT,
+              help='Number of HaplotypeCaller shards per sample of generated scatter. '
+                   'Defaults to available CPUs divided by number of samples')
+@click.option('--calling_regions', type=click.Path(exists=True, dir_okay=False),
+              help='BED or interval list file with regions to call, used to generate HaplotypeCaller scatter')
+@click.option('--available_cpu', type=click.INT,
+              help='CPUs available to run workflow tasks, used to choose number of HaplotypeCaller shards. '
+                   'Defaults to CPUs of this host')
+@click.argument('destination', type=click.Path())
+def ingest_runs(
+        hosts, hosts_file, landing_directories, marker, sample_sheet, name_regex, fastq_subdir, platform_name,
+        sequencing_center, disable_platform_unit, reference, genome_version, poll_time, max_concurrent,
+        retry_failed, retry_delay, once, sleep_time, move, oom_retries, oom_max_mem_gb, delete_intermediates,
+        gatk_path_override, gotc_path_override, samtools_path_override, bwa_commandline_override, align_num_cpu,
+        direct_fastq_alignment, reblock_gvcf, reblock_gvcf_mem_gb, hc_scatter, hc_shards, calling_regions,
+        available_cpu, destination):
+    """Watch landing directories and run haplotype-calling workflow for each completed sequencing run"""
+    import espresso.api as api
+    import espresso.ingest as ingest
+    import espresso.servers as servers
+
+    pipeline = api.Pipeline(
+        servers.collect_hosts(hosts, hosts_file), reference, genome_version, sleep_time, move,
+        oom_retries=oom_retries, oom_max_mem_gb=oom_max_mem_gb, delete_intermediates=delete_intermediates)
+
+    ingest.watch(
+        landing_directories=landing_directories,
+        destination=abspath(destination),
+        pipeline=pipeline,
+        marker=marker,
+        poll_time=poll_time,
+        max_concurrent=max_concurrent,
+        retry_failed=retry_failed,
+        retry_delay=retry_delay,
+        once=once,
+        platform_name=platform_name,
+        sequencing_center=sequencing_center,
+        disable_platform_unit=disable_platform_unit,
+        fastq_subdir=fastq_subdir,
+        name_regex=name_regex or ingest.RUN_NAME_REGEX,
+        sample_sheet=sample_sheet,
+        gatk_path_override=gatk_path_override,
+        gotc_path_override=gotc_path_override,
+        samtools_path_override=samtools_path_override,
+        bwa_commandline_override=bwa_commandline_override,
+        align_num_cpu=align_num_cpu,
+        direct_fastq_alignment=direct_fastq_alignment,
+        reblock_gvcf=reblock_gvcf,
+        reblock_gvcf_mem_gb=reblock_gvcf_mem_gb,
+        hc_scatter=hc_scatter,
+        hc_shards=hc_shards,
+        calling_regions=calling_regions,
+        available_cpu=available_cpu)
@@ -1,7 +1,9 @@
 """FASTQ related functions"""
 import gzip
+from math import ceil
+import re
 
-from os.path import abspath
+from os.path import abspath, getsize
 from .util import search_regex, extract_sample_name
 
 
@@ -52,6 +54,42 @@ def extract_platform_unit(fastq_file):
     finally:
         file.close()
 
+
+def build_read_group(sample_name, library_name, platform_unit, run_date, platform_name, sequencing_center):
+    """
+    Build SAM read group header line given to BWA, with the same fields FastqToSam writes into uBAM.
+    Fields are separated by literal '\\t' that BWA converts to tabs
+    :param sample_name: sample name, also used as read group ID
+    :param library_name: library name
+    :param platform_unit: platform unit
+    :param run_date: run date in ISO8601 format
+    :param platform_name: sequencing platform
+    :param sequencing_center: sequencing center
+    :return: str
+    :raise Exception if a value contains whitespace or quotes
+    """
+    fields = [('ID', sample_name), ('SM', sample_name), ('LB', library_name), ('PU', platform_unit),
+              ('DT', run_date), ('PL', platform_name), ('CN', sequencing_center)]
+    invalid_values = sorted(set(value for tag, value in fields if re.search('[\\s\'"\\\\]', value)))
+    if len(invalid_values) != 0:
+        raise Exception('Read group values must not contain whitespace, quotes or backslashes: ' +
+                        ', '.join(invalid_values))
+    return '\\t'.join(['@RG'] + ['{}:{}'.format(tag, value) for tag, value in fields])
+
+
+def compute_num_chunks(fastq_files, chunk_size_gb):
+    """
+    Compute the number of read chunks a sample is split into based on the size of its FASTQ files
+    :param fastq_files: list of FASTQ files of a single sample (forward and reverse)
+    :param chunk_size_gb: size in GB of FASTQ data aligned by each chunk
+    :return: number of chunks, at least one
+    """
+    if chunk_size_gb <= 0:
+        raise Exception('Chunk size must be greater than zero: {}'.format(chunk_size_gb))
+    total_size_gb = sum(getsize(f) for f in fastq_files) / 1024 ** 3
+    return max(1, int(ceil(total_size_gb / chunk_size_gb)))
+
+
 # TODO caller should use extract_platform_unit directly
 def extract_platform_units(fastq_files):
     return [extract_platform_unit(f) for f in fastq_files]
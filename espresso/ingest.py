@@ -0,0 +1,285 @@
+"""Watch-folder ingestion of sequencing runs"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from json import load, dump
+from os import listdir, makedirs
+from os.path import join, isdir, isfile, exists, basename, abspath
+import re
+from time import sleep, time
+
+import click
+
+from . import cromwell as cromwell
+from .servers import load_submission
+
+# Illumina run folder name: YYMMDD_INSTRUMENT_RUN_FLOWCELL
+RUN_NAME_REGEX = '^(?P<date>\\d{6})_(?P<instrument>[^_]+)_(?P<run>\\d+)_(?P<flowcell>[^_]+)$'
+
+RUN_DATE_FORMATS = ['%Y-%m-%d', '%Y%m%d', '%y%m%d', '%m/%d/%Y', '%d/%m/%Y', '%Y/%m/%d']
+
+# Runs recorded with these statuses were interrupted before finishing and are processed again
+INTERRUPTED_STATUSES = ['Queued', 'Running']
+
+# Statuses of a previous submission that is waited for instead of submitting the workflow again
+RESUMABLE_STATUSES = ['Submitted', 'Running', 'Succeeded']
+
+
+def normalize_run_date(date):
+    """
+    Convert run date from sample sheet or run folder name to ISO8601 format
+    :param date: date in one of RUN_DATE_FORMATS
+    :return: date in YYYY-MM-DD format
+    :raise Exception if date format is not recognized
+    """
+    for date_format in RUN_DATE_FORMATS:
+        try:
+            return datetime.strptime(date.strip(), date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    raise Exception('Invalid run date: ' + date)
+
+
+def read_sample_sheet(file):
+    """
+    Read [Header] section of Illumina sample sheet
+    :param file: sample sheet CSV file
+    :return: dict containing header fields
+    """
+    header = {}
+    section = None
+    with open(file) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('['):
+                section = line.strip('[],')
+                continue
+            if section != 'Header' or not line:
+                continue
+            fields = line.split(',')
+            if fields[0]:
+                header[fields[0]] = fields[1] if len(fields) > 1 else ''
+    return header
+
+
+def extract_run_metadata(run_directory, name_regex=RUN_NAME_REGEX, sample_sheet='SampleSheet.csv'):
+    """
+    Extract library name and run date of a sequencing run.
+    Values from sample sheet header ('Experiment Name' and 'Date') take precedence over
+    values extracted from run directory name ('library' and 'date' regex groups).
+    When library name is not found run directory name is used.
+    :param run_directory: run directory
+    :param name_regex: regex to extract 'library' and 'date' from run directory name
+    :param sample_sheet: sample sheet file name inside run directory
+    :return: library name and run date in ISO8601 format
+    """
+
+    name = basename(abspath(run_directory))
+    metadata = {}
+    result = re.search(name_regex, name)
+    if result:
+        metadata.update({k: v for k, v in result.groupdict().items() if v})
+
+    sample_sheet_file = join(run_directory, sample_sheet)
+    if sample_sheet and isfile(sample_sheet_file):
+        header = read_sample_sheet(sample_sheet_file)
+        if header.get('Experiment Name'):
+            metadata['library'] = header.get('Experiment Name')
+        if header.get('Date'):
+            metadata['date'] = header.get('Date')
+
+    if 'date' not in metadata.keys():
+        raise Exception('Unable to extract run date from ' + run_directory)
+
+    return metadata.get('library', name), normalize_run_date(metadata['date'])
+
+
+def find_ready_runs(landing_directories, marker):
+    """
+    Search run directories that have completion marker
+    :param landing_directories: list of directories containing run directories
+    :param marker: file name that indicates that run is complete
+    :return: list of run directories
+    """
+    runs = []
+    for landing_directory in landing_directories:
+        for name in sorted(listdir(landing_directory)):
+            run_directory = abspath(join(landing_directory, name))
+            if isdir(run_directory) and exists(join(run_directory, marker)):
+                runs.append(run_directory)
+    return runs
+
+
+def load_state(state_file):
+    """
+    Load ingestion state
+    :param state_file: JSON file
+    :return: dict containing run directory and dict with status, attempts and retry_after
+    """
+    if not exists(state_file):
+        return {}
+    with open(state_file) as file:
+        state = load(file)
+    # state files written by previous versions record only the status of each run
+    return {run_directory: entry if isinstance(entry, dict) else dict(status=entry, attempts=1, retry_after=0)
+            for run_directory, entry in state.items()}
+
+
+def save_state(state_file, state):
+    """
+    Save ingestion state
+    :param state_file: JSON file
+    :param state: dict containing run directory and dict with status, attempts and retry_after
+    """
+    with open(state_file, 'w') as file:
+        dump(state, file, indent=4, sort_keys=True)
+
+
+def is_pending(entry, retry_failed=0):
+    """
+    Check if a run recorded in ingestion state has to be processed
+    :param entry: dict containing status, attempts and retry_after, or None if run is not recorded
+    :param retry_failed: maximum number of times a failed run is processed again
+    :return: True if run was not processed yet, was interrupted, or failed and its retry is due
+    """
+    if entry is None or entry['status'] in INTERRUPTED_STATUSES:
+        return True
+    return entry['status'] == 'Failed' and entry['attempts'] <= retry_failed and time() >= entry['retry_after']
+
+
+def abort_run(run_directory, destination):
+    """
+    Abort haplotype-calling workflow last submitted for a run
+    :param run_directory: run directory
+    :param destination: directory to write run results, one sub-directory per run
+    """
+    submission = load_submission('haplotype-calling', join(destination, basename(run_directory)))
+    if submission is None:
+        return
+    try:
+        cromwell.abort(submission['host'], submission['workflow_id'])
+        click.echo('Aborted workflow {} of run {}'.format(submission['workflow_id'], basename(run_directory)),
+                   err=True)
+    except Exception as e:
+        click.echo('Unable to abort workflow {}: {}'.format(submission['workflow_id'], e), err=True)
+
+
+def process_run(
+        run_directory, destination, pipeline, platform_name, sequencing_center,
+        disable_platform_unit=False, fastq_subdir='', name_regex=RUN_NAME_REGEX,
+        sample_sheet='SampleSheet.csv', **kwargs):
+    """
+    Submit haplotype-calling workflow for a sequencing run and wait to complete.
+    A workflow submitted for this run by a previous process that is still running (or succeeded)
+    is waited for instead of being submitted again
+    :param run_directory: run directory
+    :param destination: directory to write run results, one sub-directory per run
+    :param pipeline: api.Pipeline used to submit workflows
+    :param platform_name: sequencing platform
+    :param sequencing_center: sequencing center
+    :param disable_platform_unit: disable extraction of platform unit from FASTQ header
+    :param fastq_subdir: directory containing FASTQ files relative to run directory
+    :param name_regex: regex to extract 'library' and 'date' from run directory name
+    :param sample_sheet: sample sheet file name inside run directory
+    :param kwargs: other arguments passed to haplotype_calling_inputs
+    :return: workflow status
+    """
+
+    name = basename(run_directory)
+    try:
+        library_name, run_date = extract_run_metadata(run_directory, name_regex, sample_sheet)
+        click.echo('Ingesting run {} (library {}, date {})'.format(name, library_name, run_date), err=True)
+
+        inputs = pipeline.haplotype_calling_inputs(
+            directories=[join(run_directory, fastq_subdir)],
+            library_names=[library_name],
+            run_dates=[run_date],
+            platform_name=platform_name,
+            sequencing_center=sequencing_center,
+            disable_platform_unit=disable_platform_unit,
+            **kwargs)
+        files = pipeline.prepare('haplotype-calling', inputs, join(destination, name), batch=name)
+        previous = pipeline.last_submission(files)
+        if previous and submission_status(pipeline, previous) in RESUMABLE_STATUSES:
+            click.echo('Resuming workflow {} of run {}'.format(previous.workflow_id, name), err=True)
+            return pipeline.run(files, submission=previous).status
+        return pipeline.run(files).status
+    except Exception as e:
+        click.echo('Run {} failed: {}'.format(name, e), err=True)
+        return 'Failed'
+
+
+def submission_status(pipeline, submission):
+    """
+    Retrieve status of a previous submission
+    :param pipeline: api.Pipeline
+    :param submission: api.Submission
+    :return: workflow status or None if it can not be retrieved
+    """
+    try:
+        return pipeline.status(submission)
+    except Exception as e:
+        click.echo('Unable to retrieve status of workflow {}: {}'.format(submission.workflow_id, e), err=True)
+        return None
+
+
+def watch(
+        landing_directories, destination, pipeline, marker, poll_time=60,
+        max_concurrent=1, once=False, retry_failed=3, retry_delay=600, **kwargs):
+    """
+    Watch landing directories submitting haplotype-calling workflow for each completed run.
+    Processed runs are recorded in 'ingest.json' file in destination. Succeeded runs are not submitted again;
+    runs interrupted by a previous process are processed again and failed runs are retried with exponential backoff.
+    On Ctrl-C workflows of runs being processed are aborted
+    :param landing_directories: list of directories containing run directories
+    :param destination: directory to write run results, one sub-directory per run
+    :param pipeline: api.Pipeline used to submit workflows, shared by all runs
+    :param marker: file name (relative to run directory) that indicates that FASTQ files of a run are complete
+    :param poll_time: time in seconds to sleep between landing directories scan
+    :param max_concurrent: maximum number of runs processed at the same time
+    :param once: process completed runs found in first scan and exit
+    :param retry_failed: maximum number of times a failed run is processed again
+    :param retry_delay: time in seconds to wait before retrying a failed run, doubled after each failure
+    :param kwargs: arguments passed to process_run
+    """
+
+    makedirs(destination, exist_ok=True)
+    state_file = join(destination, 'ingest.json')
+    state = load_state(state_file)
+    running = {}
+
+    executor = ThreadPoolExecutor(max_workers=max_concurrent)
+    try:
+        scan = True
+        while True:
+            if scan:
+                for run_directory in find_ready_runs(landing_directories, marker):
+                    if run_directory in running.keys() or not is_pending(state.get(run_directory), retry_failed):
+                        continue
+                    entry = state.setdefault(run_directory, dict(attempts=0, retry_after=0))
+                    entry['status'] = 'Queued'
+                    running[run_directory] = executor.submit(
+                        process_run, run_directory, destination, pipeline, **kwargs)
+                save_state(state_file, state)
+                scan = not once
+
+            for run_directory, future in list(running.items()):
+                if future.done():
+                    entry = state[run_directory]
+                    entry['status'] = future.result()
+                    entry['attempts'] += 1
+                    entry['retry_after'] = time() + retry_delay * 2 ** (entry['attempts'] - 1)
+                    del running[run_directory]
+                    save_state(state_file, state)
+
+            if once and not running:
+                break
+            sleep(poll_time if scan else 1)
+    except KeyboardInterrupt:
+        click.echo('Aborting workflows of {} runs.'.format(len(running)), err=True)
+        for run_directory, future in running.items():
+            if not future.cancel():
+                abort_run(run_directory, destination)
+        raise
+    finally:
+        executor.shutdown(wait=False)
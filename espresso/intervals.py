@@ -0,0 +1,362 @@
+"""Target intervals (BED or Picard interval list) processing for exome and targeted sequencing"""
+
+from hashlib import sha256
+from os import makedirs, replace, getpid
+from os.path import join, exists, abspath, dirname
+import re
+
+from .util import cache_directory
+
+# Chromosomes called by HaplotypeCaller when scatter is generated from reference (autosomes, X and Y)
+PRIMARY_CONTIG_REGEX = '^(chr)?([0-9]+|X|Y)$'
+
+# Runs of N bases at least this long split calling intervals
+MIN_N_GAP = 500
+
+# Bytes of FASTA read at a time when searching for runs of N bases
+FASTA_BLOCK_SIZE = 1 << 24
+
+# Maximum number of target intervals given to joint-discovery, each one imported and genotyped as a separate shard
+JOINT_MAX_TARGET_INTERVALS = 500
+
+
+def read_sequence_dictionary(dict_file):
+    """
+    Read sequence names and lengths from a sequence dictionary (.dict) file
+    :param dict_file: sequence dictionary file
+    :return: list of tuples containing sequence name and length, in dictionary order
+    """
+    sequences = []
+    with open(dict_file) as file:
+        for line in file:
+            if not line.startswith('@SQ'):
+                continue
+            fields = dict(field.split(':', 1) for field in line.rstrip('\n').split('\t')[1:])
+            sequences.append((fields['SN'], int(fields['LN'])))
+    return sequences
+
+
+def read_intervals(intervals_file):
+    """
+    Read intervals from BED, Picard interval list or GATK list (chr:start-end) file
+    :param intervals_file: intervals file
+    :return: list of tuples containing contig, start and end (1-based, inclusive)
+    """
+    is_bed = intervals_file.lower().endswith('.bed')
+    intervals = []
+    with open(intervals_file) as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith(('@', '#', 'track', 'browser')):
+                continue
+            if '\t' not in line and ':' in line:
+                contig, span = line.rsplit(':', 1)
+                start, end = span.split('-')
+                intervals.append((contig, int(start), int(end)))
+                continue
+            fields = line.split('\t')
+            start = int(fields[1]) + 1 if is_bed else int(fields[1])
+            intervals.append((fields[0], start, int(fields[2])))
+    if len(intervals) == 0:
+        raise Exception('Intervals not found in ' + intervals_file)
+    return intervals
+
+
+def pad_intervals(intervals, padding, sequences):
+    """
+    Pad intervals, sort them by sequence dictionary order and merge overlapping or adjacent intervals
+    :param intervals: list of tuples containing contig, start and end
+    :param padding: number of bases added to both sides of each interval
+    :param sequences: list of tuples containing sequence name and length
+    :return: list of tuples containing contig, start and end
+    """
+    order = {name: (idx, length) for idx, (name, length) in enumerate(sequences)}
+    unknown_contigs = sorted(set(contig for contig, start, end in intervals if contig not in order.keys()))
+    if len(unknown_contigs) != 0:
+        raise Exception('Contigs not found in sequence dictionary: ' + ', '.join(unknown_contigs))
+
+    padded = sorted(
+        ((contig, max(1, start - padding), min(order[contig][1], end + padding)) for contig, start, end in intervals),
+        key=lambda interval: (order[interval[0]][0], interval[1]))
+
+    merged = []
+    for contig, start, end in padded:
+        if merged and merged[-1][0] == contig and start <= merged[-1][2] + 1:
+            merged[-1] = (contig, merged[-1][1], max(end, merged[-1][2]))
+        else:
+            merged.append((contig, start, end))
+    return merged
+
+
+def split_intervals(intervals, num_shards):
+    """
+    Split intervals in shards of similar size in base pairs keeping intervals in order.
+    Intervals larger than a shard are cut at shard boundaries; smaller ones are kept whole
+    in the shard where their midpoint falls
+    :param intervals: list of tuples containing contig, start and end
+    :param num_shards: maximum number of shards
+    :return: list of shards, each one a list of intervals
+    """
+    if len(intervals) == 0:
+        return []
+    total_bp = sum(end - start + 1 for contig, start, end in intervals)
+    num_shards = max(1, min(num_shards, total_bp))
+    shard_bp = total_bp / num_shards
+    shards = [[]]
+    position = 0
+    for contig, start, end in intervals:
+        while len(shards) < num_shards and position + end - start + 1 > len(shards) * shard_bp:
+            size = end - start + 1
+            room = int(round(len(shards) * shard_bp - position))
+            if size > shard_bp and 0 < room < size:
+                shards[-1].append((contig, start, start + room - 1))
+                position += room
+                start += room
+            elif room >= size or (size <= shard_bp and position + size / 2 <= len(shards) * shard_bp):
+                break
+            if not shards[-1]:
+                break
+            shards.append([])
+        shards[-1].append((contig, start, end))
+        position += end - start + 1
+    return shards
+
+
+def write_interval_list(intervals, dict_file, output_file):
+    """
+    Write intervals as Picard interval list using header of sequence dictionary
+    :param intervals: list of tuples containing contig, start and end
+    :param dict_file: sequence dictionary file
+    :param output_file: interval list file to write
+    """
+    with open(dict_file) as file:
+        header = [line for line in file if line.startswith('@')]
+    with open(output_file, 'w') as file:
+        file.writelines(header)
+        for contig, start, end in intervals:
+            file.write('{}\t{}\t{}\t+\t.\n'.format(contig, start, end))
+
+
+def group_intervals(intervals, max_intervals):
+    """
+    Merge the closest intervals of each contig until there are at most max_intervals, so that the largest gaps
+    between intervals are kept out
+    :param intervals: sorted list of tuples containing contig, start and end, not overlapping
+    :param max_intervals: maximum number of intervals
+    :return: list of tuples containing contig, start and end
+    """
+    gaps = sorted(start - intervals[idx - 1][2] - 1 for idx, (contig, start, end) in enumerate(intervals)
+                  if idx > 0 and intervals[idx - 1][0] == contig)
+    num_merges = len(intervals) - max(1, max_intervals)
+    if num_merges <= 0 or not gaps:
+        return list(intervals)
+    max_gap = gaps[min(num_merges, len(gaps)) - 1]
+
+    groups = []
+    for contig, start, end in intervals:
+        if groups and groups[-1][0] == contig and start - groups[-1][2] - 1 <= max_gap:
+            groups[-1] = (contig, groups[-1][1], end)
+        else:
+            groups.append((contig, start, end))
+    return groups
+
+
+def intervals_directory(*keys):
+    """
+    Create a cache directory for interval files derived from the given files and parameters
+    :param keys: file paths and parameters that identify the interval files
+    :return: path to directory
+    """
+    digest = sha256()
+    for key in keys:
+        digest.update(str(key).encode())
+        if isinstance(key, str) and exists(key):
+            with open(key, 'rb') as file:
+                digest.update(file.read())
+    directory = join(cache_directory(), 'intervals', digest.hexdigest()[:16])
+    makedirs(directory, exist_ok=True)
+    return directory
+
+
+def read_fasta_index(fai_file):
+    """
+    Read sequence names, lengths and byte offsets from a FASTA index (.fai) file
+    :param fai_file: FASTA index file
+    :return: list of tuples containing sequence name, length, offset, bases per line and bytes per line
+    """
+    sequences = []
+    with open(fai_file) as file:
+        for line in file:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 5:
+                continue
+            sequences.append((fields[0],) + tuple(int(field) for field in fields[1:5]))
+    return sequences
+
+
+def find_n_gaps(fasta_file, sequence, min_gap=MIN_N_GAP):
+    """
+    Search runs of N bases of a sequence, reading it from FASTA file in blocks of whole lines
+    :param fasta_file: FASTA file
+    :param sequence: tuple containing sequence name, length, offset, bases per line and bytes per line
+    :param min_gap: minimum number of N bases of a run
+    :return: list of tuples containing start and end of each run (1-based, inclusive)
+    """
+    name, length, offset, line_bases, line_bytes = sequence
+    total_bytes = length // line_bases * line_bytes + length % line_bases
+    block_size = max(1, FASTA_BLOCK_SIZE // line_bytes) * line_bytes
+
+    gaps = []
+    position = 0
+    with open(fasta_file, 'rb') as file:
+        file.seek(offset)
+        while total_bytes > 0:
+            block = file.read(min(block_size, total_bytes))
+            if not block:
+                break
+            total_bytes -= len(block)
+            bases = block.replace(b'\n', b'').replace(b'\r', b'')
+            for match in re.finditer(b'[Nn]+', bases):
+                start, end = position + match.start() + 1, position + match.end()
+                if gaps and gaps[-1][1] == start - 1:
+                    gaps[-1] = (gaps[-1][0], end)
+                else:
+                    gaps.append((start, end))
+            position += len(bases)
+    return [(start, end) for start, end in gaps if end - start + 1 >= min_gap]
+
+
+def reference_calling_intervals(fasta_file, fai_file, min_gap=MIN_N_GAP):
+    """
+    Split primary chromosomes of reference genome at runs of N bases.
+    All sequences are used if none of them is named as a primary chromosome
+    :param fasta_file: FASTA file of reference genome
+    :param fai_file: FASTA index file of reference genome
+    :param min_gap: minimum number of N bases of a run that splits a chromosome
+    :return: list of tuples containing contig, start and end
+    """
+    sequences = read_fasta_index(fai_file)
+    primary_sequences = [sequence for sequence in sequences if re.match(PRIMARY_CONTIG_REGEX, sequence[0])]
+
+    intervals = []
+    for sequence in primary_sequences or sequences:
+        start = 1
+        for gap_start, gap_end in find_n_gaps(fasta_file, sequence, min_gap):
+            if gap_start > start:
+                intervals.append((sequence[0], start, gap_start - 1))
+            start = gap_end + 1
+        if start <= sequence[1]:
+            intervals.append((sequence[0], start, sequence[1]))
+    if len(intervals) == 0:
+        raise Exception('Calling intervals not found in reference genome ' + fasta_file)
+    return intervals
+
+
+def write_list_file(lines, output_file):
+    """
+    Write lines to a file atomically so that concurrent calls never read a partial file
+    :param lines: list of str
+    :param output_file: file to write
+    """
+    tmp_file = '{}.{}.tmp'.format(output_file, getpid())
+    with open(tmp_file, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+    replace(tmp_file, output_file)
+
+
+def scatter_targets(targets_file, padding, dict_file, num_shards):
+    """
+    Pad targets and split them in interval lists balanced by size.
+    Files are written once to espresso cache directory and reused
+    :param targets_file: BED or interval list file with target intervals
+    :param padding: number of bases added to both sides of each target
+    :param dict_file: sequence dictionary file of reference genome
+    :param num_shards: maximum number of interval lists
+    :return: path to file listing interval list files, one per line
+    """
+    targets_file = abspath(targets_file)
+    directory = intervals_directory(targets_file, padding, dict_file, num_shards)
+    list_file = join(directory, 'scattered_calling_intervals.txt')
+    if exists(list_file):
+        return list_file
+
+    intervals = pad_intervals(read_intervals(targets_file), padding, read_sequence_dictionary(dict_file))
+    write_scattered_intervals(intervals, dict_file, num_shards, list_file)
+    return list_file
+
+
+def write_scattered_intervals(intervals, dict_file, num_shards, list_file):
+    """
+    Split intervals in interval lists balanced by size, written next to the file that lists them
+    :param intervals: list of tuples containing contig, start and end
+    :param dict_file: sequence dictionary file of reference genome
+    :param num_shards: maximum number of interval lists
+    :param list_file: file listing interval list files, one per line
+    """
+    directory = dirname(list_file)
+    interval_files = []
+    for idx, shard in enumerate(split_intervals(intervals, num_shards)):
+        interval_file = join(directory, 'shard_{:04d}.interval_list'.format(idx))
+        write_interval_list(shard, dict_file, interval_file)
+        interval_files.append(interval_file)
+    write_list_file(interval_files, list_file)
+
+
+def scatter_reference(fasta_file, fai_file, dict_file, num_shards, calling_regions=None):
+    """
+    Split calling regions in interval lists balanced by size for HaplotypeCaller scatter.
+    Without calling regions file, primary chromosomes of reference genome are split at runs of N bases.
+    Calling intervals are computed once per reference and interval lists once per number of shards,
+    both written to espresso cache directory and reused
+    :param fasta_file: FASTA file of reference genome
+    :param fai_file: FASTA index file of reference genome
+    :param dict_file: sequence dictionary file of reference genome
+    :param num_shards: maximum number of interval lists
+    :param calling_regions: BED or interval list file with regions to call, instead of whole reference genome
+    :return: path to file listing interval list files, one per line
+    """
+    if calling_regions:
+        calling_regions = abspath(calling_regions)
+        regions_directory = intervals_directory(calling_regions, dict_file, 'regions')
+    else:
+        # FASTA is identified by its path and index instead of its content, which is too large to hash
+        regions_directory = intervals_directory('fasta:' + abspath(fasta_file), fai_file, MIN_N_GAP)
+    regions_file = join(regions_directory, 'calling_regions.interval_list')
+
+    if exists(regions_file):
+        intervals = read_intervals(regions_file)
+    else:
+        if calling_regions:
+            intervals = pad_intervals(read_intervals(calling_regions), 0, read_sequence_dictionary(dict_file))
+        else:
+            intervals = reference_calling_intervals(fasta_file, fai_file)
+        tmp_file = '{}.{}.tmp'.format(regions_file, getpid())
+        write_interval_list(intervals, dict_file, tmp_file)
+        replace(tmp_file, regions_file)
+
+    directory = intervals_directory(regions_file, num_shards)
+    list_file = join(directory, 'scattered_calling_intervals.txt')
+    if not exists(list_file):
+        write_scattered_intervals(intervals, dict_file, num_shards, list_file)
+    return list_file
+
+
+def targets_unpadded_intervals(targets_file, padding, dict_file, max_intervals=JOINT_MAX_TARGET_INTERVALS):
+    """
+    Write padded and merged targets used to shard GenomicsDB import and genotyping, one interval per shard.
+    Closest targets are grouped when there are more than max_intervals, leaving out the largest off-target gaps.
+    File is written once to espresso cache directory and reused
+    :param targets_file: BED or interval list file with target intervals
+    :param padding: number of bases added to both sides of each target
+    :param dict_file: sequence dictionary file of reference genome
+    :param max_intervals: maximum number of intervals
+    :return: path to intervals file in contig:start-end format
+    """
+    targets_file = abspath(targets_file)
+    directory = intervals_directory(targets_file, padding, dict_file, max_intervals, 'groups')
+    groups_file = join(directory, 'unpadded_intervals.list')
+    if not exists(groups_file):
+        intervals = pad_intervals(read_intervals(targets_file), padding, read_sequence_dictionary(dict_file))
+        write_list_file(['{}:{}-{}'.format(contig, start, end)
+                         for contig, start, end in group_intervals(intervals, max_intervals)], groups_file)
+    return groups_file
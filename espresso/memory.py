@@ -0,0 +1,153 @@
+"""Out-of-memory detection and memory escalation of failed tasks"""
+
+from itertools import chain
+from math import ceil
+from os.path import isfile, getsize
+import re
+
+# Task (or call alias) name: (workflow input, default memory in GB, whether workflow input is Int)
+TASK_MEMORY_INPUTS = {
+    'PairedFastQsToUnmappedBAM': ('HaplotypeCalling.fastq_bam_mem_gb', 7, False),
+    'SamToFastqAndBwaMem': ('HaplotypeCalling.align_mem_gb', 14, False),
+    'BwaMemFromFastq': ('HaplotypeCalling.align_mem_gb', 14, False),
+    'MergeBamAlignment': ('HaplotypeCalling.merge_bam_mem_gb', 4, False),
+    'MarkDuplicates': ('HaplotypeCalling.mark_duplicates_mem_gb', 7.5, False),
+    'MarkDuplicatesSpark': ('HaplotypeCalling.mark_duplicates_mem_gb', 32, False),
+    'SortAndFixTags': ('HaplotypeCalling.sort_mem_gb', 10, False),
+    'BaseRecalibrator': ('HaplotypeCalling.baserecalibrator_mem_gb', 6, False),
+    'ApplyBQSR': ('HaplotypeCalling.aplly_bqsr_mem_gb', 4, False),
+    'HaplotypeCaller': ('HaplotypeCalling.haplotype_caller_mem_gb', 7, True),
+    'MergeGVCFs': ('HaplotypeCalling.merge_gvcfs_mem_gb', 3, True),
+    'ReblockGVCF': ('HaplotypeCalling.reblock_gvcf_mem_gb', 4, True),
+    'ValidateBAM': ('HaplotypeCalling.validate_bam_mem_gb', 4, False),
+    'ImportGVCFs': ('JointGenotyping.import_mem_gb', 7, True),
+    'IndelsVariantRecalibrator': ('JointGenotyping.indels_variant_recalibrator_mem_gb', 26, False),
+    'SNPsVariantRecalibratorCreateModel': ('JointGenotyping.snps_model_mem_gb', 104, False),
+    'SNPsVariantRecalibratorClassic': ('JointGenotyping.snps_variant_recalibrator_mem_gb', 3.5, False),
+    'SNPsVariantRecalibratorScattered': ('JointGenotyping.snps_variant_recalibrator_mem_gb', 3.5, False)}
+
+# Task name: (workflow input, default Java heap in GB) of tasks whose heap (-Xmx) is set apart from task memory,
+# without default heap the task derives it from its memory
+TASK_JAVA_MEMORY_INPUTS = {
+    'ImportGVCFs': ('JointGenotyping.import_java_mem_gb', 4),
+    'SNPsVariantRecalibratorClassic': ('JointGenotyping.snps_variant_recalibrator_java_mem_gb', None)}
+
+OOM_REGEX = re.compile(
+    r'OutOfMemoryError|Cannot allocate memory|std::bad_alloc|MemoryError|oom[-_ ]kill|\bKilled\b',
+    re.IGNORECASE)
+
+# Exit code of a process killed by SIGKILL, usually sent by the kernel OOM killer or the container runtime
+OOM_RETURN_CODE = 137
+
+MEMORY_FACTOR = 1.5
+
+
+def find_failed_calls(metadata):
+    """
+    Search failed calls in workflow metadata, including calls of sub-workflows
+    :param metadata: workflow metadata with expanded sub-workflows
+    :return: list of tuples containing task name and call metadata
+    """
+
+    failed_calls = []
+    for name, calls in metadata.get('calls', {}).items():
+        for call in calls:
+            if 'subWorkflowMetadata' in call:
+                failed_calls += find_failed_calls(call['subWorkflowMetadata'])
+            elif call.get('executionStatus') == 'Failed':
+                failed_calls.append((name.split('.')[-1], call))
+    return failed_calls
+
+
+def failure_messages(failures):
+    """
+    Flatten Cromwell failure messages and their causes
+    :param failures: list of failures from call metadata
+    :return: list of str
+    """
+    return list(chain.from_iterable(
+        [failure.get('message', '')] + failure_messages(failure.get('causedBy', [])) for failure in failures))
+
+
+def read_tail(file, size=65536):
+    """
+    Read the end of a text file
+    :param file: file path
+    :param size: maximum number of bytes to read
+    :return: str or an empty str if file is not found
+    """
+    if not file or not isfile(file):
+        return ''
+    with open(file, 'rb') as f:
+        f.seek(max(0, getsize(file) - size))
+        return f.read().decode(errors='replace')
+
+
+def is_out_of_memory(call):
+    """
+    Check if a failed call ran out of memory looking at its return code, failure messages and stderr
+    :param call: call metadata
+    :return: True if an out of memory signature is found
+    """
+    if call.get('returnCode') == OOM_RETURN_CODE:
+        return True
+    messages = failure_messages(call.get('failures', []))
+    messages.append(read_tail(call.get('stderr')))
+    return any(OOM_REGEX.search(message) for message in messages)
+
+
+def escalate_memory(inputs, task, max_mem_gb, factor=MEMORY_FACTOR):
+    """
+    Increase memory of a task in workflow inputs within a ceiling.
+    Java heap of tasks in TASK_JAVA_MEMORY_INPUTS is increased in the same proportion, below task memory
+    :param inputs: dict containing inputs data, updated in place
+    :param task: task name
+    :param max_mem_gb: maximum memory in GB
+    :param factor: memory multiplier
+    :return: tuple containing workflow input, previous and new memory or None if memory can't be increased
+    """
+
+    if task not in TASK_MEMORY_INPUTS.keys():
+        return None
+    param, default_mem_gb, is_int = TASK_MEMORY_INPUTS.get(task)
+
+    mem_gb = inputs.get(param, default_mem_gb)
+    new_mem_gb = min(mem_gb * factor, max_mem_gb)
+    if is_int:
+        new_mem_gb = int(min(ceil(mem_gb * factor), max_mem_gb))
+    if new_mem_gb <= mem_gb:
+        return None
+
+    inputs[param] = new_mem_gb
+    if task in TASK_JAVA_MEMORY_INPUTS.keys():
+        java_param, default_java_mem_gb = TASK_JAVA_MEMORY_INPUTS.get(task)
+        java_mem_gb = inputs.get(java_param, default_java_mem_gb)
+        if java_mem_gb is not None:
+            inputs[java_param] = max(java_mem_gb, min(int(java_mem_gb * new_mem_gb / mem_gb), int(new_mem_gb) - 1))
+    return param, mem_gb, new_mem_gb
+
+
+def escalate_failed_tasks(metadata, inputs, max_mem_gb, factor=MEMORY_FACTOR):
+    """
+    Increase memory of tasks that failed due to lack of memory
+    :param metadata: workflow metadata with expanded sub-workflows
+    :param inputs: dict containing inputs data, updated in place
+    :param max_mem_gb: maximum memory in GB
+    :param factor: memory multiplier
+    :return: list of dict describing each escalation
+    """
+
+    escalations = []
+    escalated_params = set()
+    for task, call in find_failed_calls(metadata):
+        if not is_out_of_memory(call):
+            continue
+        param = TASK_MEMORY_INPUTS.get(task, (None,))[0]
+        if param in escalated_params:
+            continue
+        escalation = escalate_memory(inputs, task, max_mem_gb, factor)
+        if escalation:
+            escalated_params.add(param)
+            escalations.append(dict(task=task, input=escalation[0],
+                                    previous_mem_gb=escalation[1], mem_gb=escalation[2]))
+    return escalations
@@ -1,10 +1,10 @@
 """Reference (genome, dbSNP) related functions"""
 
 from json import load
-
-from pkg_resources import resource_filename
 from os.path import isfile, join, abspath, exists
 
+from .util import resource_path
+
 
 def join_list_mixed(x, sep=', '):
     """
@@ -39,8 +39,7 @@ def load_references(workflow, version):
     :param version: Version of reference files
     :return: list of Reference
     """
-    json_file = resource_filename(
-        __name__, 'inputs/{}.{}.resources.json'.format(workflow, version))
+    json_file = resource_path('inputs/{}.{}.resources.json'.format(workflow, version))
     if not exists(json_file):
         return []
     with open(json_file) as file:
@@ -68,12 +67,13 @@ def check_intervals_files(intervals_file):
             intervals_file) + '\n'.join(missing_files))
 
 
-def collect_resources_files(reference_dir, workflow, version):
+def collect_resources_files(reference_dir, workflow, version, optional=()):
     """
     Search for reference files and update reference-related input dict
     :param reference_dir: Path of directory to search
     :param workflow: Workflow name
     :param version: Version of reference files
+    :param optional: parameters whose files may be missing, they are left out of returned dict
     :return: dict containing reference-related data updated with absolute path to files
     :raise Exception if file not found
     """
@@ -90,6 +90,8 @@ def collect_resources_files(reference_dir, workflow, version):
             if isfile(file):
                 reference.path = file
 
+    references = [reference for reference in references if reference.path is not None
+                  or reference.param not in optional]
     missing_references = [
         reference.filename for reference in references if reference.path is None]
 
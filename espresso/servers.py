@@ -0,0 +1,159 @@
+"""Selection of Cromwell servers and record of submitted workflows"""
+
+from datetime import datetime
+from json import load, dump
+from os.path import join, isfile
+from threading import Lock
+
+import click
+
+from . import cromwell as cromwell
+
+# Statuses of workflows that are occupying a Cromwell server
+ACTIVE_STATUSES = ['Submitted', 'Running']
+
+# Time in seconds to wait for a server to answer its load
+LOAD_TIMEOUT = 10
+
+# Submissions of this process are serialized so that each one sees the workflows submitted before it
+_submit_lock = Lock()
+
+
+def read_hosts_file(hosts_file):
+    """
+    Read Cromwell server URLs from file, one per line. Empty lines and lines starting with '#' are ignored
+    :param hosts_file: text file
+    :return: list of Cromwell server URLs
+    """
+    with open(hosts_file) as file:
+        hosts = [line.strip() for line in file if line.strip() and not line.strip().startswith('#')]
+    if len(hosts) == 0:
+        raise Exception('Cromwell servers not found in ' + hosts_file)
+    return hosts
+
+
+def collect_hosts(hosts=(), hosts_file=None):
+    """
+    Combine Cromwell server URLs from command line and hosts file, removing duplicates
+    :param hosts: list of Cromwell server URLs
+    :param hosts_file: text file with one Cromwell server URL per line
+    :return: list of Cromwell server URLs, empty if none was given
+    """
+    hosts = list(hosts or [])
+    if hosts_file:
+        hosts += read_hosts_file(hosts_file)
+    hosts = [host.rstrip('/') for host in hosts]
+    return [host for idx, host in enumerate(hosts) if host not in hosts[:idx]]
+
+
+def server_load(host):
+    """
+    Count workflows that are submitted or running in a Cromwell server
+    :param host: Cromwell server URL
+    :return: number of active workflows
+    """
+    return cromwell.query(host, status=ACTIVE_STATUSES, timeout=LOAD_TIMEOUT).get('totalResultsCount', 0)
+
+
+def is_unreachable(error):
+    """
+    Check if a request failed because the server could not be reached
+    :param error: exception raised by a Cromwell request
+    :return: True if connection failed or timed out
+    """
+    import requests
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def rank_servers(hosts):
+    """
+    Order Cromwell servers by number of active workflows.
+    Servers that do not answer are placed last, so that they are only tried if all other servers fail
+    :param hosts: list of Cromwell server URLs
+    :return: list of Cromwell server URLs
+    """
+    if len(hosts) < 2:
+        return list(hosts)
+
+    loads = {}
+    for host in hosts:
+        try:
+            loads[host] = server_load(host)
+            click.echo('Cromwell server {} has {} active workflows'.format(host, loads[host]), err=True)
+        except Exception as e:
+            click.echo('Unable to query Cromwell server {}: {}'.format(host, e), err=True)
+    return sorted(hosts, key=lambda host: (host not in loads.keys(), loads.get(host, 0)))
+
+
+def submit_failover(hosts, submit):
+    """
+    Submit a workflow to the first Cromwell server that is reachable
+    :param hosts: list of Cromwell server URLs, in order of preference
+    :param submit: function that receives a Cromwell server URL and returns the workflow ID
+    :return: Cromwell server URL and workflow ID
+    :raise Exception if no server is reachable
+    """
+    for host in hosts:
+        try:
+            return host, submit(host)
+        except Exception as e:
+            if not is_unreachable(e) or host == hosts[-1]:
+                raise
+            click.echo('Cromwell server {} is unreachable, trying next server: {}'.format(host, e), err=True)
+
+
+def submit_balanced(hosts, submit, preferred_host=None):
+    """
+    Submit a workflow to the Cromwell server with fewer active workflows, trying the next one when
+    a server is unreachable
+    :param hosts: list of Cromwell server URLs
+    :param submit: function that receives a Cromwell server URL and returns the workflow ID
+    :param preferred_host: server tried first regardless of its load, if it is in hosts
+    :return: Cromwell server URL and workflow ID
+    """
+    with _submit_lock:
+        hosts = rank_servers(hosts)
+        if preferred_host in hosts:
+            hosts.remove(preferred_host)
+            hosts.insert(0, preferred_host)
+        return submit_failover(hosts, submit)
+
+
+def submission_file(workflow, destination):
+    """
+    Path to file that records the last submission of a workflow
+    :param workflow: workflow name
+    :param destination: destination directory
+    :return: path to JSON file
+    """
+    return join(destination, workflow + '.submission.json')
+
+
+def record_submission(workflow, destination, host, workflow_id):
+    """
+    Record Cromwell server and workflow ID of a submission in destination
+    :param workflow: workflow name
+    :param destination: destination directory
+    :param host: Cromwell server URL
+    :param workflow_id: workflow ID
+    :return: path to JSON file
+    """
+    file_path = submission_file(workflow, destination)
+    with open(file_path, 'w') as file:
+        dump(dict(workflow=workflow, host=host, workflow_id=workflow_id,
+                  submitted=datetime.now().strftime('%Y-%m-%dT%H:%M:%S')), file, indent=4, sort_keys=True)
+    return file_path
+
+
+def load_submission(workflow, destination):
+    """
+    Load last submission of a workflow recorded in destination
+    :param workflow: workflow name
+    :param destination: destination directory
+    :return: dict containing workflow, host, workflow_id and submitted, or None if workflow was not submitted
+    """
+    file_path = submission_file(workflow, destination)
+    if not isfile(file_path):
+        return None
+    with open(file_path) as file:
+        return load(file)
@@ -0,0 +1,218 @@
+"""Resource tuning of workflow tasks according to cohort size and host resources"""
+
+import gzip
+from math import ceil
+import os
+
+GIB = 1024 ** 3
+
+# HaplotypeCaller scatter generated from reference is limited to this number of shards per sample,
+# smaller shards add more task overhead than they save
+HC_MAX_SHARDS = 100
+
+# GenomicsDBImport merges batches of gVCFs; batches larger than 50 do not reduce import time
+# and multithreaded reader initialization does not scale beyond 5 threads
+GENOMICSDB_MAX_BATCH_SIZE = 50
+GENOMICSDB_MAX_READER_THREADS = 5
+
+# Compressed gVCF data (in GB) imported by each GenomicsDB shard
+GENOMICSDB_SHARD_SIZE_GB = 2
+
+# SNP sites of a single sample per GB of compressed gVCF (about 3.6 million SNPs in a 6 GB WGS gVCF)
+SNPS_PER_GVCF_GB = 600000
+
+# VariantRecalibrator memory: fixed overhead and memory per million SNP sites used to build the model
+VQSR_BASE_MEM_GB = 2
+VQSR_MEM_GB_PER_MILLION_SITES = 0.5
+VQSR_MIN_MEM_GB = 3.5
+VQSR_MODEL_MIN_MEM_GB = 8
+# Non-heap memory reserved in SNPsVariantRecalibratorCreateModel and SNPsVariantRecalibrator tasks
+VQSR_MODEL_OVERHEAD_GB = 4
+VQSR_JAVA_OVERHEAD_GB = 2
+
+# Maximum number of SNP sites used to build the model of scattered VQSR, more sites are downsampled
+VQSR_MAX_MODEL_SITES = 10000000
+
+# Callsets larger than this use scattered VQSR (same threshold as joint-discovery workflow)
+VQSR_SCATTER_MIN_GVCFS = 10000
+
+
+def host_cpu_count():
+    """
+    Number of CPUs of this host
+    :return: int
+    """
+    return os.cpu_count() or 1
+
+
+def host_memory_gb():
+    """
+    Physical memory of this host
+    :return: memory in GB or None if it can not be determined
+    """
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / GIB
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def count_intervals(intervals_file):
+    """
+    Count intervals of a list file, one interval per line
+    :param intervals_file: intervals list file
+    :return: number of non-empty lines
+    """
+    with open(intervals_file) as file:
+        return sum(1 for line in file if line.strip())
+
+
+def hc_scatter_count(num_samples, available_cpu=None, max_shards=HC_MAX_SHARDS):
+    """
+    Choose number of HaplotypeCaller shards per sample so that shards of all samples occupy available CPUs
+    :param num_samples: number of samples called at the same time
+    :param available_cpu: CPUs available to run workflow tasks, defaults to CPUs of this host
+    :param max_shards: maximum number of shards
+    :return: number of shards
+    """
+    available_cpu = available_cpu or host_cpu_count()
+    return max(1, min(max_shards, int(ceil(available_cpu / max(1, num_samples)))))
+
+
+def genomicsdb_import_memory(batch_size):
+    """
+    Java heap and task memory required to import a batch of gVCFs.
+    Non-heap memory used by native GenomicsDB libraries grows with batch size as the heap does
+    :param batch_size: number of gVCFs imported at the same time
+    :return: Java heap in GB and task memory in GB
+    """
+    java_mem_gb = max(2, int(ceil(batch_size * 0.08)))
+    native_mem_gb = max(1, int(ceil(batch_size * 0.06)))
+    return java_mem_gb, java_mem_gb + native_mem_gb
+
+
+def plan_genomicsdb_import(num_gvcfs, gvcfs_size_gb, num_intervals, available_cpu=None, available_mem_gb=None):
+    """
+    Choose GenomicsDBImport batch size, reader threads, memory and number of intervals merged per shard.
+    Small cohorts are imported in a single batch with two shards per parallel import slot;
+    large cohorts are split in shards of about GENOMICSDB_SHARD_SIZE_GB of gVCF data
+    :param num_gvcfs: number of gVCF files
+    :param gvcfs_size_gb: total size of gVCF files in GB
+    :param num_intervals: number of intervals in unpadded intervals file
+    :param available_cpu: CPUs available to run workflow tasks, defaults to CPUs of this host
+    :param available_mem_gb: memory in GB available to run workflow tasks, defaults to memory of this host
+    :return: dict containing batch_size, reader_threads, java_mem_gb, mem_gb and merge_count
+    """
+
+    if num_gvcfs < 1:
+        raise Exception('At least one gVCF file is required')
+
+    available_cpu = available_cpu or host_cpu_count()
+    available_mem_gb = available_mem_gb or host_memory_gb() or GENOMICSDB_MAX_BATCH_SIZE
+
+    batch_size = min(num_gvcfs, GENOMICSDB_MAX_BATCH_SIZE)
+    java_mem_gb, mem_gb = genomicsdb_import_memory(batch_size)
+    while mem_gb > available_mem_gb and batch_size > 1:
+        batch_size = batch_size // 2
+        java_mem_gb, mem_gb = genomicsdb_import_memory(batch_size)
+
+    reader_threads = max(1, min(GENOMICSDB_MAX_READER_THREADS, batch_size, available_cpu))
+    # imports that fit in available resources at the same time, Cromwell backend limits how many actually run
+    parallel_imports = max(1, min(available_cpu // reader_threads, int(available_mem_gb // mem_gb)))
+
+    num_shards = max(parallel_imports * 2, int(ceil(gvcfs_size_gb / GENOMICSDB_SHARD_SIZE_GB)))
+    merge_count = max(1, num_intervals // num_shards)
+
+    return dict(batch_size=batch_size, reader_threads=reader_threads, java_mem_gb=java_mem_gb,
+                mem_gb=mem_gb, merge_count=merge_count)
+
+
+def harmonic_number(n):
+    """
+    Sum of 1/i for i from 1 to n
+    :param n: int
+    :return: float
+    """
+    return sum(1 / i for i in range(1, n + 1))
+
+
+def estimate_snp_sites(num_gvcfs, gvcfs_size_gb):
+    """
+    Estimate number of SNP sites of a callset from the size of its gVCF files.
+    Sites of an average sample are derived from its gVCF size and, following Watterson's estimator,
+    the number of segregating sites grows with the harmonic number of the number of chromosomes
+    :param num_gvcfs: number of gVCF files
+    :param gvcfs_size_gb: total size of gVCF files in GB
+    :return: estimated number of SNP sites
+    """
+    sample_sites = gvcfs_size_gb / num_gvcfs * SNPS_PER_GVCF_GB
+    return int(sample_sites * harmonic_number(2 * num_gvcfs - 1))
+
+
+def count_snp_sites(vcf_file):
+    """
+    Count SNP sites of a (sites-only) VCF file
+    :param vcf_file: VCF file, optionally compressed
+    :return: number of records whose reference and alternative alleles are single bases
+    """
+    opener = gzip.open if vcf_file.endswith('.gz') else open
+    count = 0
+    with opener(vcf_file, 'rt') as file:
+        for line in file:
+            if line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t', 5)
+            if len(fields[3]) == 1 and all(len(alt) == 1 for alt in fields[4].split(',')):
+                count += 1
+    return count
+
+
+def vqsr_memory(num_sites):
+    """
+    Memory required by VariantRecalibrator to build a model
+    :param num_sites: number of SNP sites used to build the model
+    :return: memory in GB
+    """
+    return VQSR_BASE_MEM_GB + VQSR_MEM_GB_PER_MILLION_SITES * num_sites / 1000000
+
+
+def plan_vqsr(num_gvcfs, snp_sites, mode='auto', available_mem_gb=None):
+    """
+    Choose between classic and scattered SNP VQSR and their memory and downsample factor.
+    Classic VQSR is used unless the callset is larger than VQSR_SCATTER_MIN_GVCFS or its model does not fit
+    in available memory; scattered VQSR builds its model from at most VQSR_MAX_MODEL_SITES sites
+    :param num_gvcfs: number of gVCF files
+    :param snp_sites: number of SNP sites of the callset
+    :param mode: 'auto', 'classic' or 'scattered'
+    :param available_mem_gb: memory in GB available to run workflow tasks, defaults to memory of this host
+    :return: dict containing scattered, snps_java_mem_gb, snps_mem_gb, model_mem_gb and downsample_factor
+    """
+
+    if mode not in ['auto', 'classic', 'scattered']:
+        raise Exception('Invalid VQSR mode: ' + mode)
+    available_mem_gb = available_mem_gb or host_memory_gb()
+
+    snps_java_mem_gb = int(ceil(vqsr_memory(snp_sites)))
+    snps_mem_gb = max(VQSR_MIN_MEM_GB, snps_java_mem_gb + VQSR_JAVA_OVERHEAD_GB)
+    if mode == 'auto':
+        scattered = num_gvcfs > VQSR_SCATTER_MIN_GVCFS or (
+            available_mem_gb is not None and snps_mem_gb > available_mem_gb)
+    else:
+        scattered = mode == 'scattered'
+
+    max_model_sites = VQSR_MAX_MODEL_SITES
+    if available_mem_gb is not None and available_mem_gb < VQSR_MODEL_MIN_MEM_GB:
+        # the model of scattered VQSR can not be built with less memory, whatever its downsample factor
+        if scattered:
+            raise Exception('Scattered VQSR requires at least {} GB of memory to build its model, {} GB available'
+                            .format(VQSR_MODEL_MIN_MEM_GB, available_mem_gb))
+    elif available_mem_gb is not None:
+        mem_bound_sites = (available_mem_gb - VQSR_MODEL_OVERHEAD_GB - VQSR_BASE_MEM_GB) \
+                          / VQSR_MEM_GB_PER_MILLION_SITES * 1000000
+        max_model_sites = min(max_model_sites, mem_bound_sites)
+
+    downsample_factor = max(1, int(ceil(snp_sites / max_model_sites)))
+    model_mem_gb = max(VQSR_MODEL_MIN_MEM_GB,
+                       ceil(vqsr_memory(snp_sites / downsample_factor)) + VQSR_MODEL_OVERHEAD_GB)
+
+    return dict(scattered=scattered, snps_java_mem_gb=snps_java_mem_gb, snps_mem_gb=snps_mem_gb,
+                model_mem_gb=model_mem_gb, downsample_factor=downsample_factor)
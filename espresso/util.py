@@ -1,7 +1,7 @@
 """Utility functions"""
 
-from os import listdir
-from os.path import join, basename
+from os import listdir, environ
+from os.path import join, basename, dirname, abspath, expanduser
 import re
 
 
@@ -31,3 +31,23 @@ def extract_sample_name(file, regex):
         raise Exception('Unable to extract sample name from ' + filename)
 
     return result.group('sample')
+
+
+def resource_path(path):
+    """
+    Return file system path to a file distributed with espresso package
+    :param path: path relative to package directory, e.g. 'workflows/haplotype-calling.wdl'
+    :return: absolute path to file
+    """
+    return join(dirname(abspath(__file__)), path)
+
+
+def cache_directory():
+    """
+    Return directory to store files reused between espresso calls.
+    ESPRESSO_CACHE_DIR environment variable takes precedence over XDG_CACHE_HOME
+    :return: path to cache directory, it may not exist yet
+    """
+    if environ.get('ESPRESSO_CACHE_DIR'):
+        return environ.get('ESPRESSO_CACHE_DIR')
+    return join(environ.get('XDG_CACHE_HOME') or expanduser('~/.cache'), 'espresso')
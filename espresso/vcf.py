@@ -1,12 +1,57 @@
 """Variant Call Format (VCF) related functions"""
-from os.path import abspath
+from os.path import abspath, isfile, getsize
+import re
 
 from .util import search_regex, extract_sample_name
 
+# ReblockGVCF output files are named <sample>.rb.g.vcf.gz
+REBLOCKED_VCF_REGEX = '\\.rb\\.g\\.vcf(\\.gz)?$'
 
-def collect_vcf_files(directory, prefix='', vcf_name_regex='(?P<sample>.+?)(\\.\\w+?)?\\.g\\.vcf(\\.gz)?$'):
+# Default GATK docker image of HaplotypeCallerGvcf_GATK4 sub-workflow, which runs ReblockGVCF
+HC_GATK_DOCKER = 'broadinstitute/gatk:4.1.4.0'
+
+
+def is_reblocked(vcf_file):
+    """
+    Check if a gVCF file was reblocked by ReblockGVCF
+    :param vcf_file: gVCF file
+    :return: True if file name ends with .rb.g.vcf(.gz)
+    """
+    return re.search(REBLOCKED_VCF_REGEX, vcf_file, re.IGNORECASE) is not None
+
+
+def check_gvcf(vcf_file, index_file):
+    """
+    Check a gVCF file before joint genotyping: compressed files must be block gzip (BGZF) and indexed
+    :param vcf_file: gVCF file
+    :param index_file: gVCF index file
+    :raise Exception if gVCF or its index is missing, empty or not block gzip compressed
+    """
+    for file in [vcf_file, index_file]:
+        if not isfile(file) or getsize(file) == 0:
+            raise Exception('gVCF file is missing or empty: ' + file)
+    if vcf_file.endswith('.gz'):
+        with open(vcf_file, 'rb') as file:
+            header = file.read(14)
+        if header[:4] != b'\x1f\x8b\x08\x04' or header[12:14] != b'BC':
+            raise Exception('gVCF file is not block gzip compressed: ' + vcf_file)
+
+
+def full_resolution_file(vcf_file):
+    """
+    Name of the gVCF file a reblocked gVCF file was derived from
+    :param vcf_file: reblocked gVCF file
+    :return: file path without .rb before .g.vcf(.gz)
+    """
+    return re.sub('\\.rb(\\.g\\.vcf(\\.gz)?)$', '\\1', vcf_file, flags=re.IGNORECASE)
+
+
+def collect_vcf_files(directory, prefix='',
+                      vcf_name_regex='(?P<sample>.+?)(\\.\\w+?)?(\\.rb)?\\.g\\.vcf(\\.gz)?$'):
     """
-    Collect sample name and absolute path to VCF and its index file
+    Collect sample name and absolute path to VCF and its index file.
+    Reblocked gVCF files (.rb.g.vcf.gz) are collected as well; a full-resolution file is skipped
+    when its reblocked file is in the same directory
     :param directory: list of directories to search
     :param prefix: prepend to sample name
     :param vcf_name_regex: regular expression to extract sample name from file name
@@ -14,19 +59,17 @@ def collect_vcf_files(directory, prefix='', vcf_name_regex='(?P<sample>.+?)(\\.\
     """
 
     vcf_files = search_regex(directory, '\\.g\\.vcf(\\.gz)?$')
-    vcf_index_files = search_regex(directory, '\\.g\\.vcf(\\.gz)?\\.tbi$')
 
-    vcf_len = len(vcf_files)
-    index_len = len(vcf_index_files)
-
-    if vcf_len == 0:
+    if len(vcf_files) == 0:
         raise Exception('VCF files not found in {}'.format(directory))
 
-    if vcf_len != index_len:
-        raise Exception('VCF and index files not even. VCF: {}, Index: {}'.format(vcf_len, index_len))
+    replaced_files = [full_resolution_file(vcf) for vcf in vcf_files if is_reblocked(vcf)]
+    vcf_files = sorted(vcf for vcf in vcf_files if vcf not in replaced_files)
+
+    missing_index_files = [vcf + '.tbi' for vcf in vcf_files if not isfile(vcf + '.tbi')]
+    if len(missing_index_files) != 0:
+        raise Exception('VCF index files not found: ' + ', '.join(missing_index_files))
 
-    vcf_files.sort()
-    vcf_index_files.sort()
     sample_names = [prefix + extract_sample_name(f, vcf_name_regex) for f in vcf_files]
 
-    return sample_names, [abspath(vcf) for vcf in vcf_files], [abspath(index) for index in vcf_index_files]
+    return sample_names, [abspath(vcf) for vcf in vcf_files], [abspath(vcf + '.tbi') for vcf in vcf_files]
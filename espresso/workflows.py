@@ -1,21 +1,27 @@
 """Workflow input JSON generation and workflow submssion"""
 
+from hashlib import sha256
 import shutil
 from itertools import chain
 from json import load, dump
-from os.path import abspath, isfile, exists, join, basename
+from os import link, makedirs, remove, replace, getpid
+from os.path import abspath, isfile, exists, join, basename, getsize
 import re
 from time import sleep
 from zipfile import ZipFile
-import sys
 
 import click
-from pkg_resources import resource_filename
 
 from . import cromwell as cromwell
-from .fastq import collect_fastq_files, extract_platform_units
+from .fastq import collect_fastq_files, extract_platform_units, compute_num_chunks, build_read_group
+from .intervals import scatter_targets, targets_unpadded_intervals, scatter_reference
+from .memory import escalate_failed_tasks
 from .references import collect_resources_files, check_intervals_files
-from .vcf import collect_vcf_files
+from .servers import submit_balanced, record_submission, load_submission
+from .tuning import plan_genomicsdb_import, count_intervals, GIB, estimate_snp_sites, count_snp_sites, plan_vqsr, \
+    hc_scatter_count
+from .util import search_regex, resource_path, cache_directory
+from .vcf import collect_vcf_files, is_reblocked, check_gvcf
 
 WORKFLOW_FILES = {
     'haplotype-calling': 'workflows/haplotype-calling.wdl',
@@ -31,14 +37,39 @@ IMPORTS_FILES = {
         'bam-to-cram', 'haplotypecaller-gvcf-gatk4', 'paired-fastq-to-unmapped-bam',
         'processing-for-variant-discovery-gatk4', 'validate-bam']}
 
+DEFAULT_HOST = 'http://localhost:8000'
+
+DEFAULT_OOM_MAX_MEM_GB = 64
+
+# Sub-workflow call of 'haplotype-calling' that writes the gVCF file of each sample
+GVCF_CALL = 'HaplotypeCalling.HaplotypeCallerGvcf_GATK4'
+GVCF_METADATA_KEYS = ['executionStatus', 'outputs']
+
+
+class WorkflowError(click.ClickException):
+    """Raised when a workflow does not succeed"""
+
+    def __init__(self, workflow, workflow_id, status):
+        """
+        Creates a WorkflowError
+        :param workflow: workflow name
+        :param workflow_id: workflow ID
+        :param status: workflow status
+        """
+        super().__init__('Workflow {} ({}) terminated: {}'.format(workflow, workflow_id, status))
+        self.workflow = workflow
+        self.workflow_id = workflow_id
+        self.status = status
+
 
 def submit_workflow(
         host, workflow, genome_version, inputs, destination, sleep_time=5,
-        dont_run=False, move=False):
+        dont_run=False, move=False, callset_name=None, batch=None, call_caching=True,
+        oom_retries=0, oom_max_mem_gb=None, delete_intermediates=False):
     """
     Copy workflow file into destination; write inputs JSON file into destination;
     submit workflow to Cromwell server; wait to complete; and copy output files to destination
-    :param host: Cromwell server URL
+    :param host: Cromwell server URL or list of Cromwell server URLs
     :param workflow: workflow name
     :param genome_version: reference genome version
     :param inputs: dict containing inputs data
@@ -46,34 +77,227 @@ def submit_workflow(
     :param sleep_time: time in seconds to sleep between workflow status check
     :param dont_run: Do not submit workflow to Cromwell. Just create destination directory and write JSON and WDL files
     :param move: Move output files to destination directory instead of copying them.
+    :param callset_name: callset name used to label the workflow
+    :param batch: batch name used to label the workflow, defaults to destination directory name
+    :param call_caching: read from and write to Cromwell call cache
+    :param oom_retries: maximum number of resubmissions after out of memory failures
+    :param oom_max_mem_gb: maximum memory in GB of a task after escalation
+    :param delete_intermediates: delete intermediate output files when workflow succeeds
+    :return: Cromwell server URL, workflow ID and list of collected files or None if workflow was not submitted
+    :raise WorkflowError if workflow does not succeed
     """
 
-    pkg_workflow_file = get_workflow_file(workflow)
-    workflow_file = join(destination, basename(pkg_workflow_file))
-    shutil.copyfile(pkg_workflow_file, workflow_file)
+    workflow_file, imports_file, inputs_file, options_file, labels_file = prepare_workflow(
+        workflow, genome_version, inputs, destination, callset_name, batch, call_caching,
+        delete_intermediates)
 
-    click.echo('Workflow file: ' + workflow_file, err=True)
+    if dont_run:
+        click.echo(
+            'Workflow will not be submitted to Cromwell. See workflow files in ' + destination)
+        return None
 
-    imports_file = zip_imports_files(workflow, destination)
-    if imports_file:
-        click.echo('Workflow imports file: ' + imports_file)
+    return run_workflow(
+        host, workflow, genome_version, workflow_file, inputs_file, destination,
+        imports_file, options_file, labels_file, sleep_time, move, call_caching,
+        oom_retries, oom_max_mem_gb)
 
-    inputs_file = join(
-        destination, '{}.{}.inputs.json'.format(workflow, genome_version))
-    with open(inputs_file, 'w') as file:
-        dump(inputs, file, indent=4, sort_keys=True)
 
-    click.echo('Inputs JSON file: ' + inputs_file, err=True)
+def prepare_workflow(
+        workflow, genome_version, inputs, destination, callset_name=None, batch=None, call_caching=True,
+        delete_intermediates=False):
+    """
+    Create destination directory and write workflow, imports, inputs, options and labels files into it
+    :param workflow: workflow name
+    :param genome_version: reference genome version
+    :param inputs: dict containing inputs data
+    :param destination: directory to write all files
+    :param callset_name: callset name used to label the workflow
+    :param batch: batch name used to label the workflow, defaults to destination directory name
+    :param call_caching: read from and write to Cromwell call cache
+    :param delete_intermediates: delete intermediate output files when workflow succeeds
+    :return: paths to workflow, imports (or None), inputs, options and labels files
+    """
 
-    if dont_run:
-        click.echo(
-            'Workflow will not be submitted to Cromwell. See workflow files in ' + destination)
-        exit()
+    makedirs(destination, exist_ok=True)
+
+    workflow_file, imports_file, inputs_file = write_workflow_files(
+        workflow, genome_version, inputs, destination)
+
+    options_file = write_options_file(workflow, destination, call_caching, delete_intermediates)
+    click.echo('Workflow options file: ' + options_file, err=True)
+
+    if batch is None:
+        batch = basename(destination)
+    labels_file = write_labels_file(
+        workflow, destination, make_labels(workflow, callset_name, batch))
+    click.echo('Workflow labels file: ' + labels_file, err=True)
+
+    return workflow_file, imports_file, inputs_file, options_file, labels_file
+
+
+def resume_workflow(
+        host, workflow, destination, sleep_time=5, move=False, oom_retries=0, oom_max_mem_gb=None):
+    """
+    Resubmit a workflow using the inputs JSON and WDL files previously written into destination.
+    Call caching is enabled so that calls that succeeded before are not executed again
+    :param host: Cromwell server URL or list of Cromwell server URLs
+    :param workflow: workflow name
+    :param destination: directory containing workflow files of the previous run
+    :param sleep_time: time in seconds to sleep between workflow status check
+    :param move: Move output files to destination directory instead of copying them.
+    :param oom_retries: maximum number of resubmissions after out of memory failures
+    :param oom_max_mem_gb: maximum memory in GB of a task after escalation
+    :return: Cromwell server URL, workflow ID and list of collected files
+    :raise WorkflowError if workflow does not succeed
+    """
 
-    if not host:
-        host = 'http://localhost:8000'
-    workflow_id = cromwell.submit(
-        host, workflow_file, inputs_file, dependencies=imports_file)
+    genome_version, workflow_file, imports_file, inputs_file, options_file, labels_file = find_workflow_files(
+        workflow, destination)
+
+    return run_workflow(
+        host, workflow, genome_version, workflow_file, inputs_file, destination,
+        imports_file, options_file, labels_file, sleep_time, move, True,
+        oom_retries, oom_max_mem_gb)
+
+
+def find_workflow_files(workflow, destination):
+    """
+    Find workflow files previously written into destination to resubmit a workflow.
+    Options file is rewritten enabling call caching (keeping deletion of intermediate files)
+    and labels file is written if missing
+    :param workflow: workflow name
+    :param destination: directory containing workflow files of the previous run
+    :return: genome version and paths to workflow, imports (or None), inputs, options and labels files
+    """
+
+    workflow_file = join(destination, basename(get_workflow_file(workflow)))
+    if not isfile(workflow_file):
+        raise Exception('Workflow file not found: ' + workflow_file)
+
+    inputs_files = search_regex(
+        destination, '^{}\\.\\w+\\.inputs\\.json$'.format(re.escape(workflow)))
+    if len(inputs_files) != 1:
+        raise Exception('Expected one inputs JSON file for {} in {}, found {}'.format(
+            workflow, destination, len(inputs_files)))
+    inputs_file = inputs_files[0]
+    genome_version = basename(inputs_file).split('.')[-3]
+
+    imports_file = None
+    if workflow in IMPORTS_FILES.keys():
+        imports_file = join(destination, workflow + '.imports.zip')
+        if not isfile(imports_file):
+            raise Exception('Workflow imports file not found: ' + imports_file)
+
+    labels_file = join(destination, workflow + '.labels.json')
+    if not isfile(labels_file):
+        labels_file = write_labels_file(
+            workflow, destination, make_labels(workflow, batch=basename(destination)))
+
+    options_file = join(destination, workflow + '.options.json')
+    delete_intermediates = False
+    if isfile(options_file):
+        with open(options_file) as file:
+            delete_intermediates = load(file).get('delete_intermediate_output_files', False)
+    options_file = write_options_file(workflow, destination, True, delete_intermediates)
+
+    return genome_version, workflow_file, imports_file, inputs_file, options_file, labels_file
+
+
+def run_workflow(
+        host, workflow, genome_version, workflow_file, inputs_file, destination,
+        imports_file=None, options_file=None, labels_file=None, sleep_time=5,
+        move=False, report_cache_hits=False, oom_retries=0, oom_max_mem_gb=None,
+        submitted=None, on_poll=None, staged_files=None):
+    """
+    Submit workflow to Cromwell server; wait to complete; and copy output files to destination.
+    When tasks fail due to lack of memory the workflow is resubmitted with more memory for those tasks
+    :param host: Cromwell server URL or list of Cromwell server URLs
+    :param workflow: workflow name
+    :param genome_version: reference genome version
+    :param workflow_file: WDL file
+    :param inputs_file: inputs JSON file
+    :param destination: directory to write output files
+    :param imports_file: ZIP file containing sub-workflows
+    :param options_file: workflow options JSON file
+    :param labels_file: workflow labels JSON file
+    :param sleep_time: time in seconds to sleep between workflow status check
+    :param move: Move output files to destination directory instead of copying them.
+    :param report_cache_hits: report call cache hit ratio when workflow terminates
+    :param oom_retries: maximum number of resubmissions after out of memory failures
+    :param oom_max_mem_gb: maximum memory in GB of a task after escalation
+    :param submitted: tuple containing Cromwell server URL and ID of a workflow already submitted,
+    that is waited for instead of submitting it again
+    :param on_poll: function called with Cromwell server URL and workflow ID after each status check
+    while the workflow is running and once it succeeds
+    :param staged_files: dict of output file names and paths already in destination, not collected again
+    :return: Cromwell server URL, workflow ID and list of collected files
+    :raise WorkflowError if workflow does not succeed
+    """
+
+    attempt = 0
+    while True:
+        if submitted:
+            server, workflow_id = submitted
+            submitted = None
+        else:
+            server, workflow_id = start_workflow(
+                host, workflow, genome_version, workflow_file, inputs_file,
+                imports_file, options_file, labels_file, destination)
+
+        try:
+            while True:
+                sleep(sleep_time)
+                status = check_workflow(server, workflow_id)
+                if on_poll and status in [None, 'Succeeded']:
+                    on_poll(server, workflow_id)
+                if status is not None:
+                    break
+        except KeyboardInterrupt:
+            click.echo('Aborting workflow.')
+            cromwell.abort(server, workflow_id)
+            raise
+
+        if status != 'Failed' or attempt >= oom_retries or not retry_out_of_memory(
+                server, workflow, workflow_id, inputs_file, destination, oom_max_mem_gb):
+            break
+
+        attempt += 1
+        click.echo('Resubmitting workflow ({}/{})'.format(attempt, oom_retries), err=True)
+
+    return (server,) + finish_workflow(
+        server, workflow, workflow_id, status, destination, move, report_cache_hits, staged_files)
+
+
+def start_workflow(
+        host, workflow, genome_version, workflow_file, inputs_file, imports_file=None,
+        options_file=None, labels_file=None, destination=None):
+    """
+    Submit workflow to the least loaded Cromwell server, trying the next one when a server is unreachable.
+    When destination is given, the server of a previous submission of the same workflow is preferred
+    (so that its call cache is used) and the new submission is recorded
+    :param host: Cromwell server URL or list of Cromwell server URLs
+    :param workflow: workflow name
+    :param genome_version: reference genome version
+    :param workflow_file: WDL file
+    :param inputs_file: inputs JSON file
+    :param imports_file: ZIP file containing sub-workflows
+    :param options_file: workflow options JSON file
+    :param labels_file: workflow labels JSON file
+    :param destination: directory to record submission
+    :return: Cromwell server URL and workflow ID
+    """
+
+    hosts = [host] if isinstance(host, str) else list(host or [])
+    previous = load_submission(workflow, destination) if destination else None
+
+    host, workflow_id = submit_balanced(
+        hosts or [DEFAULT_HOST],
+        lambda server: cromwell.submit(
+            server, workflow_file, inputs_file, options=options_file,
+            dependencies=imports_file, labels=labels_file),
+        previous['host'] if previous else None)
+    if destination:
+        record_submission(workflow, destination, host, workflow_id)
 
     click.echo('Workflow submitted to Cromwell Server ({})'.format(host), err=True)
     click.echo('Workflow id: ' + workflow_id, err=True)
@@ -81,21 +305,114 @@ def submit_workflow(
         'Starting {} workflow with reference genome version {}.. Ctrl-C to abort.'.format(
             workflow, genome_version),
         err=True)
+    return host, workflow_id
 
-    try:
-        while True:
-            sleep(sleep_time)
-            status = cromwell.status(host, workflow_id)
-            if status != 'Submitted' and status != 'Running':
-                click.echo('Workflow terminated: ' + status, err=True)
-                break
-        if status != 'Succeeded':
-            sys.exit(1)
-    except KeyboardInterrupt:
-        click.echo('Aborting workflow.')
-        cromwell.abort(host, workflow_id)
-        sys.exit(1)
 
+def check_workflow(host, workflow_id):
+    """
+    Check whether a workflow has terminated
+    :param host: Cromwell server URL
+    :param workflow_id: workflow ID
+    :return: final workflow status or None if workflow is still running
+    """
+
+    status = cromwell.status(host, workflow_id)
+    if status == 'Submitted' or status == 'Running':
+        return None
+    click.echo('Workflow terminated: ' + status, err=True)
+    return status
+
+
+def retry_out_of_memory(host, workflow, workflow_id, inputs_file, destination, oom_max_mem_gb=None):
+    """
+    Increase memory of tasks of a failed workflow that ran out of memory, updating inputs JSON file
+    :param host: Cromwell server URL
+    :param workflow: workflow name
+    :param workflow_id: ID of the workflow that failed
+    :param inputs_file: inputs JSON file
+    :param destination: directory to write escalations file
+    :param oom_max_mem_gb: maximum memory in GB of a task after escalation
+    :return: True if memory of any task was increased and workflow should be resubmitted
+    """
+
+    metadata = cromwell.metadata(host, workflow_id, expand_sub_workflows=True)
+    with open(inputs_file) as file:
+        inputs = load(file)
+    escalations = escalate_failed_tasks(metadata, inputs, oom_max_mem_gb or DEFAULT_OOM_MAX_MEM_GB)
+    if not escalations:
+        return False
+
+    with open(inputs_file, 'w') as file:
+        dump(inputs, file, indent=4, sort_keys=True)
+    record_escalations(workflow, workflow_id, escalations, destination)
+    for escalation in escalations:
+        click.echo('Task {task} ran out of memory, increasing {input} from {previous_mem_gb} to {mem_gb} GB'.format(
+            **escalation), err=True)
+    return True
+
+
+def finish_workflow(host, workflow, workflow_id, status, destination, move=False, report_cache_hits=False,
+                    staged_files=None):
+    """
+    Report call cache hits and copy output files of a terminated workflow to destination
+    :param host: Cromwell server URL
+    :param workflow: workflow name
+    :param workflow_id: workflow ID
+    :param status: final workflow status
+    :param destination: directory to write output files
+    :param move: Move output files to destination directory instead of copying them.
+    :param report_cache_hits: report call cache hit ratio
+    :param staged_files: dict of output file names and paths already in destination, not collected again
+    :return: workflow ID and list of collected files
+    :raise WorkflowError if workflow did not succeed
+    """
+
+    if report_cache_hits:
+        hits, calls = count_cache_hits(
+            cromwell.metadata(host, workflow_id, expand_sub_workflows=True))
+        click.echo('Call cache hits: {}/{} ({:.1%})'.format(
+            hits, calls, hits / calls if calls else 0), err=True)
+    if status != 'Succeeded':
+        raise WorkflowError(workflow, workflow_id, status)
+
+    return workflow_id, collect_outputs(host, workflow_id, destination, move, staged_files)
+
+
+def record_escalations(workflow, workflow_id, escalations, destination):
+    """
+    Append memory escalations to JSON file in destination
+    :param workflow: workflow name
+    :param workflow_id: ID of the workflow that failed
+    :param escalations: list of dict describing each escalation
+    :param destination: directory to write escalations file
+    :return: path to escalations file
+    """
+
+    escalations_file = join(destination, workflow + '.memory.json')
+    records = []
+    if exists(escalations_file):
+        with open(escalations_file) as file:
+            records = load(file)
+    records += [dict(workflow_id=workflow_id, **escalation) for escalation in escalations]
+    with open(escalations_file, 'w') as file:
+        dump(records, file, indent=4, sort_keys=True)
+    return escalations_file
+
+
+def collect_outputs(host, workflow_id, destination, move=False, staged_files=None):
+    """
+    Copy (or move) workflow output files to destination
+    :param host: Cromwell server URL
+    :param workflow_id: workflow ID
+    :param destination: directory to write output files
+    :param move: Move output files to destination directory instead of copying them.
+    :param staged_files: dict of output file names and paths already in destination, not collected again
+    :return: list of files written to destination
+    """
+
+    staged_files = staged_files or {}
+
+    collected_files = []
     outputs = cromwell.outputs(host, workflow_id)
     for output in outputs.values():
         if isinstance(output, str):
@@ -106,16 +423,192 @@ def submit_workflow(
             files = output
 
         for file in files:
-            if exists(file):
+            if staged_files.get(basename(file)) == join(destination, basename(file)):
+                if move and exists(file):
+                    remove(file)
+                collected_files.append(staged_files.get(basename(file)))
+            elif exists(file):
                 destination_file = join(destination, basename(file))
                 click.echo('Collecting file ' + file, err=True)
                 if move:
                     shutil.move(file, destination_file)
                 else:
                     shutil.copyfile(file, destination_file)
+                collected_files.append(destination_file)
             else:
                 click.echo('File not found: ' + file, err=True)
 
+    return collected_files
+
+
+def called_gvcfs(metadata):
+    """
+    Find gVCF files of samples whose HaplotypeCallerGvcf_GATK4 call is done
+    :param metadata: 'haplotype-calling' workflow metadata
+    :return: list of tuples containing gVCF file and its index file
+    """
+    gvcfs = []
+    for call in metadata.get('calls', {}).get(GVCF_CALL, []):
+        outputs = {name.split('.')[-1]: value for name, value in call.get('outputs', {}).items()}
+        if call.get('executionStatus') == 'Done' and outputs.get('output_vcf') and outputs.get('output_vcf_index'):
+            gvcfs.append((outputs['output_vcf'], outputs['output_vcf_index']))
+    return gvcfs
+
+
+def stage_file(file, destination):
+    """
+    Hard link a file into destination, copying it when destination is in another file system.
+    File appears in destination only when it is complete
+    :param file: file path
+    :param destination: destination directory
+    :return: path to file in destination
+    """
+    destination_file = join(destination, basename(file))
+    tmp_file = '{}.{}.tmp'.format(destination_file, getpid())
+    if exists(tmp_file):
+        remove(tmp_file)
+    try:
+        link(file, tmp_file)
+    except OSError:
+        shutil.copyfile(file, tmp_file)
+    replace(tmp_file, destination_file)
+    return destination_file
+
+
+def stage_gvcfs(host, workflow_id, destination, staged_files):
+    """
+    Check and stage into destination gVCF files of samples already called by a running 'haplotype-calling'
+    workflow, so that they are used by joint-discovery before the workflow terminates
+    :param host: Cromwell server URL
+    :param workflow_id: workflow ID
+    :param destination: directory to write gVCF files
+    :param staged_files: dict of file names and paths already in destination, updated in place
+    :return: list of gVCF files staged by this call
+    """
+    metadata = cromwell.metadata(host, workflow_id, include_keys=GVCF_METADATA_KEYS)
+    gvcfs = []
+    for vcf_file, index_file in called_gvcfs(metadata):
+        if basename(vcf_file) in staged_files.keys():
+            continue
+        check_gvcf(vcf_file, index_file)
+        staged_files[basename(index_file)] = stage_file(index_file, destination)
+        staged_files[basename(vcf_file)] = stage_file(vcf_file, destination)
+        click.echo('Staged gVCF file ' + vcf_file, err=True)
+        gvcfs.append(staged_files[basename(vcf_file)])
+    return gvcfs
+
+
+def write_workflow_files(workflow, genome_version, inputs, destination):
+    """
+    Copy workflow file, zip its sub-workflows and write inputs JSON file into destination
+    :param workflow: workflow name
+    :param genome_version: reference genome version
+    :param inputs: dict containing inputs data
+    :param destination: directory to write all files
+    :return: paths to workflow file, imports file (or None) and inputs JSON file
+    """
+
+    pkg_workflow_file = get_workflow_file(workflow)
+    workflow_file = join(destination, basename(pkg_workflow_file))
+    shutil.copyfile(pkg_workflow_file, workflow_file)
+
+    click.echo('Workflow file: ' + workflow_file, err=True)
+
+    imports_file = zip_imports_files(workflow, destination)
+    if imports_file:
+        click.echo('Workflow imports file: ' + imports_file)
+
+    inputs_file = join(
+        destination, '{}.{}.inputs.json'.format(workflow, genome_version))
+    with open(inputs_file, 'w') as file:
+        dump(inputs, file, indent=4, sort_keys=True)
+
+    click.echo('Inputs JSON file: ' + inputs_file, err=True)
+
+    return workflow_file, imports_file, inputs_file
+
+
+def write_options_file(workflow, destination, call_caching=True, delete_intermediates=False):
+    """
+    Write workflow options JSON file into destination
+    :param workflow: workflow name
+    :param destination: directory to write options file
+    :param call_caching: read from and write to Cromwell call cache
+    :param delete_intermediates: delete intermediate output files when workflow succeeds
+    :return: path to options file
+    """
+
+    options = dict(read_from_cache=call_caching, write_to_cache=call_caching)
+    if delete_intermediates:
+        options['delete_intermediate_output_files'] = True
+    options_file = join(destination, workflow + '.options.json')
+    with open(options_file, 'w') as file:
+        dump(options, file, indent=4, sort_keys=True)
+    return options_file
+
+
+def write_labels_file(workflow, destination, labels):
+    """
+    Write workflow labels JSON file into destination
+    :param workflow: workflow name
+    :param destination: directory to write labels file
+    :param labels: dict containing labels
+    :return: path to labels file
+    """
+
+    labels_file = join(destination, workflow + '.labels.json')
+    with open(labels_file, 'w') as file:
+        dump(labels, file, indent=4, sort_keys=True)
+    return labels_file
+
+
+def make_labels(workflow, callset_name=None, batch=None):
+    """
+    Create labels that identify a workflow run in Cromwell server
+    :param workflow: workflow name
+    :param callset_name: callset name
+    :param batch: batch name
+    :return: dict containing labels
+    """
+
+    labels = {'espresso-workflow': workflow}
+    if callset_name:
+        labels['callset'] = format_label_value(callset_name)
+    if batch:
+        labels['batch'] = format_label_value(batch)
+    return labels
+
+
+def format_label_value(value):
+    """
+    Format value according to Cromwell label restrictions:
+    lower case letters, numbers and dashes up to 63 characters
+    :param value: str to format
+    :return: formatted str
+    """
+    value = re.sub('[^a-z0-9-]+', '-', value.lower())
+    return value[:63].strip('-')
+
+
+def count_cache_hits(metadata):
+    """
+    Count calls that were retrieved from call cache, including calls of sub-workflows
+    :param metadata: workflow metadata with expanded sub-workflows
+    :return: number of cache hits and number of calls
+    """
+
+    hits = calls = 0
+    for call in chain.from_iterable(metadata.get('calls', {}).values()):
+        if 'subWorkflowMetadata' in call:
+            sub_hits, sub_calls = count_cache_hits(call['subWorkflowMetadata'])
+            hits += sub_hits
+            calls += sub_calls
+        elif 'callCaching' in call:
+            calls += 1
+            if call['callCaching'].get('hit'):
+                hits += 1
+    return hits, calls
+
 
 def get_workflow_file(workflow):
     """
@@ -127,7 +620,7 @@ def get_workflow_file(workflow):
     if workflow not in WORKFLOW_FILES.keys():
         raise Exception('Workflow not found: ' + workflow)
 
-    return resource_filename(__name__, WORKFLOW_FILES.get(workflow))
+    return resource_path(WORKFLOW_FILES.get(workflow))
 
 
 def load_params_file(workflow):
@@ -139,8 +632,7 @@ def load_params_file(workflow):
     if workflow not in WORKFLOW_FILES.keys():
         raise Exception('Workflow not found: ' + workflow)
 
-    params_file = resource_filename(
-        __name__, 'inputs/{}.params.json'.format(workflow))
+    params_file = resource_path('inputs/{}.params.json'.format(workflow))
     if not exists(params_file):
         return {}
     with open(params_file) as file:
@@ -149,7 +641,9 @@ def load_params_file(workflow):
 
 def zip_imports_files(workflow, dest_dir):
     """
-    Zip WDL files and write in destination directory
+    Place zip file containing sub-workflow WDL files in destination directory.
+    The zip file is built once per content of sub-workflows (see bundle_imports_files) and
+    hard-linked into destination, falling back to copy when hard link is not possible
     :param workflow: workflow name
     :param dest_dir: destination directory
     :return: path to zip file or None if workflow does not require sub-workflows
@@ -159,13 +653,64 @@ def zip_imports_files(workflow, dest_dir):
         return None
 
     zip_file = join(dest_dir, workflow + '.imports.zip')
+    bundle_file = bundle_imports_files(workflow)
+    if bundle_file is None:
+        write_imports_zip(workflow, zip_file)
+        return zip_file
+
+    if exists(zip_file):
+        remove(zip_file)
+    try:
+        link(bundle_file, zip_file)
+    except OSError:
+        shutil.copyfile(bundle_file, zip_file)
+
+    return zip_file
+
+
+def bundle_imports_files(workflow):
+    """
+    Build zip file containing sub-workflow WDL files in cache directory.
+    File name contains a hash of sub-workflow files so that it is rebuilt only when they change
+    :param workflow: workflow name
+    :return: path to zip file or None if cache directory is not writable
+    """
+
+    digest = sha256()
+    for sub_workflow in IMPORTS_FILES.get(workflow):
+        workflow_file = get_workflow_file(sub_workflow)
+        digest.update(basename(workflow_file).encode())
+        with open(workflow_file, 'rb') as file:
+            digest.update(file.read())
+
+    cache_dir = cache_directory()
+    bundle_file = join(cache_dir, '{}.{}.imports.zip'.format(workflow, digest.hexdigest()[:16]))
+    if exists(bundle_file):
+        return bundle_file
+
+    try:
+        makedirs(cache_dir, exist_ok=True)
+        # write to temporary file and rename it so that concurrent calls never see a partial zip
+        tmp_file = '{}.{}.tmp'.format(bundle_file, getpid())
+        write_imports_zip(workflow, tmp_file)
+        replace(tmp_file, bundle_file)
+    except OSError:
+        return None
+
+    return bundle_file
+
+
+def write_imports_zip(workflow, zip_file):
+    """
+    Zip sub-workflow WDL files
+    :param workflow: workflow name
+    :param zip_file: path to zip file
+    """
     with ZipFile(zip_file, 'w') as file:
         for sub_workflow in IMPORTS_FILES.get(workflow):
             workflow_file = get_workflow_file(sub_workflow)
             file.write(workflow_file, basename(workflow_file))
 
-    return zip_file
-
 
 def haplotype_calling_inputs(
         directories, library_names, platform_name, run_dates,
@@ -175,7 +720,11 @@ def haplotype_calling_inputs(
         fastq_bam_mem_gb=None, align_mem_gb=None, merge_bam_mem_gb=None,
         mark_duplicates_mem_gb=None, sort_mem_gb=None,
         baserecalibrator_mem_gb=None, aplly_bqsr_mem_gb=None, haplotype_caller_mem_gb=None,
-        merge_gvcfs_mem_gb=None, validate_bam_mem_gb=None, align_num_cpu=None):
+        merge_gvcfs_mem_gb=None, validate_bam_mem_gb=None, align_num_cpu=None,
+        align_chunks=None, align_chunk_size_gb=None, resources=None, spark_mark_duplicates=False,
+        mark_duplicates_num_cpu=None, targets=None, padding=100, direct_fastq_alignment=False,
+        reblock_gvcf=False, reblock_gvcf_mem_gb=None, hc_scatter=False, hc_shards=None, calling_regions=None,
+        available_cpu=None):
     """
     Create inputs for 'haplotype-calling' workflow
     :param directories:
@@ -200,6 +749,20 @@ def haplotype_calling_inputs(
     :param merge_gvcfs_mem_gb:
     :param validate_bam_mem_gb:
     :param align_num_cpu:
+    :param align_chunks: number of read chunks to split each sample into for alignment
+    :param align_chunk_size_gb: size in GB of FASTQ data per read chunk, overrides align_chunks
+    :param resources: dict containing resources files previously collected by collect_haplotype_calling_resources
+    :param spark_mark_duplicates: mark duplicates and sort in a single pass with MarkDuplicatesSpark in local mode
+    :param mark_duplicates_num_cpu: number of CPU cores used by MarkDuplicatesSpark
+    :param targets: BED or interval list file with target intervals (exome or targeted sequencing)
+    :param padding: number of bases added to both sides of each target
+    :param direct_fastq_alignment: align FASTQ files directly with BWA instead of converting them to uBAM
+    :param reblock_gvcf: write reblocked gVCF files (hom-ref blocks in GQ bands) instead of full-resolution ones
+    :param reblock_gvcf_mem_gb:
+    :param hc_scatter: generate HaplotypeCaller scatter from reference instead of using its scattered intervals list
+    :param hc_shards: number of HaplotypeCaller shards per sample, defaults to fit available CPUs
+    :param calling_regions: BED or interval list file with regions to call, used to generate HaplotypeCaller scatter
+    :param available_cpu: CPUs available to run workflow tasks, used to choose number of HaplotypeCaller shards
     :return:
     """
 
@@ -210,6 +773,12 @@ def haplotype_calling_inputs(
     if len(invalid_dates) != 0:
         raise Exception('Invalid run date(s): ' + ', '.join(invalid_dates))
 
+    # reference (and read group of direct FASTQ alignment) reaches BWA only through $bash_ref_fasta,
+    # which must be followed by input files
+    if bwa_commandline_override and not re.search('\\$bash_ref_fasta\\s*$', bwa_commandline_override):
+        raise Exception('BWA command line must end with $bash_ref_fasta: ' + bwa_commandline_override)
+
+    chunks = []
     directories = [directories] if isinstance(
         directories, str) else directories
     for idx, directory in enumerate(directories):
@@ -230,10 +799,53 @@ def haplotype_calling_inputs(
         inputs['HaplotypeCalling.platform_name'] += [platform_name] * num_samples
         inputs['HaplotypeCalling.sequencing_center'] += [sequencing_center] * num_samples
 
-    inputs.update(collect_resources_files(
-        reference, 'haplotype-calling', genome_version))
-    check_intervals_files(
-        inputs['HaplotypeCalling.scattered_calling_intervals_list'])
+        if align_chunk_size_gb:
+            chunks += [compute_num_chunks([forward_file, reverse_file], align_chunk_size_gb)
+                       for forward_file, reverse_file in zip(forward_files, reverse_files)]
+        elif align_chunks:
+            chunks += [align_chunks] * num_samples
+
+    if direct_fastq_alignment:
+        if chunks:
+            raise Exception('Direct FASTQ alignment can not split reads in chunks, '
+                            'do not use align_chunks or align_chunk_size_gb')
+        inputs['HaplotypeCalling.read_group'] = [
+            build_read_group(*fields) for fields in zip(
+                inputs['HaplotypeCalling.sample_name'], inputs['HaplotypeCalling.library_name'],
+                inputs['HaplotypeCalling.platform_unit'], inputs['HaplotypeCalling.run_date'],
+                inputs['HaplotypeCalling.platform_name'], inputs['HaplotypeCalling.sequencing_center'])]
+
+    if resources is None:
+        resources = collect_haplotype_calling_resources(reference, genome_version)
+    inputs.update(resources)
+
+    if targets and calling_regions:
+        raise Exception('Use either targets or calling regions, not both')
+    hc_scatter = hc_scatter or bool(hc_shards) or bool(calling_regions)
+    static_list = inputs.get('HaplotypeCalling.scattered_calling_intervals_list')
+    if not hc_scatter and not static_list:
+        raise Exception('Scattered calling intervals list not found in reference directory, '
+                        'use hc_scatter to generate it from reference')
+
+    if hc_shards:
+        num_shards = hc_shards
+    elif hc_scatter:
+        num_shards = hc_scatter_count(len(inputs['HaplotypeCalling.sample_name']), available_cpu)
+    else:
+        num_shards = count_intervals(static_list)
+
+    # interval files of static list are used only when scatter is neither generated nor built from targets
+    if not hc_scatter and not targets:
+        check_intervals_files(static_list)
+
+    if targets:
+        targets_list = scatter_targets(targets, padding, inputs['HaplotypeCalling.ref_dict'], num_shards)
+        inputs['HaplotypeCalling.scattered_calling_intervals_list'] = targets_list
+        inputs['HaplotypeCalling.bqsr_intervals_list'] = targets_list
+    elif hc_scatter:
+        inputs['HaplotypeCalling.scattered_calling_intervals_list'] = scatter_reference(
+            inputs['HaplotypeCalling.ref_fasta'], inputs['HaplotypeCalling.ref_fasta_index'],
+            inputs['HaplotypeCalling.ref_dict'], num_shards, calling_regions)
 
     if gatk_path_override:
         if not isfile(gatk_path_override):
@@ -276,13 +888,55 @@ def haplotype_calling_inputs(
         inputs['HaplotypeCalling.validate_bam_mem_gb'] = validate_bam_mem_gb
     if align_num_cpu:
         inputs['HaplotypeCalling.align_num_cpu'] = align_num_cpu
+    if chunks:
+        inputs['HaplotypeCalling.align_chunks'] = chunks
+    if spark_mark_duplicates:
+        inputs['HaplotypeCalling.spark_mark_duplicates'] = True
+    if mark_duplicates_num_cpu:
+        inputs['HaplotypeCalling.mark_duplicates_num_cpu'] = mark_duplicates_num_cpu
+    if reblock_gvcf:
+        inputs['HaplotypeCalling.reblock_gvcf'] = True
+    if reblock_gvcf_mem_gb:
+        inputs['HaplotypeCalling.reblock_gvcf_mem_gb'] = reblock_gvcf_mem_gb
 
     return inputs
 
 
+def collect_haplotype_calling_resources(reference, genome_version):
+    """
+    Collect resources files of 'haplotype-calling' workflow.
+    Scattered calling intervals list is optional since scatter can be generated from reference
+    :param reference: directory containing reference files
+    :param genome_version: reference genome version
+    :return: dict containing resources inputs
+    """
+    return collect_resources_files(
+        reference, 'haplotype-calling', genome_version, optional=['HaplotypeCalling.scattered_calling_intervals_list'])
+
+
+def plan_joint_discovery(resources, targets=None, padding=100, sites_only_vcf=None):
+    """
+    Compute joint-discovery tuning parameters that do not depend on gVCF files, so that they can be computed
+    while samples are still being called
+    :param resources: dict containing resources files of 'joint-discovery' workflow
+    :param targets: BED or interval list file with target intervals (exome or targeted sequencing)
+    :param padding: number of bases added to both sides of each target
+    :param sites_only_vcf: sites-only VCF of a previous callset used to count SNP sites
+    :return: dict containing unpadded_intervals_file, num_intervals and snp_sites (None without sites-only VCF)
+    """
+    if targets:
+        unpadded_intervals_file = targets_unpadded_intervals(targets, padding, resources['JointGenotyping.ref_dict'])
+    else:
+        unpadded_intervals_file = resources['JointGenotyping.unpadded_intervals_file']
+    return dict(unpadded_intervals_file=unpadded_intervals_file, num_intervals=count_intervals(unpadded_intervals_file),
+                snp_sites=count_snp_sites(sites_only_vcf) if sites_only_vcf else None)
+
+
 def joint_discovery_inputs(
         directories, prefixes, reference, version, callset_name,
-        gatk_path_override=None, indels_mem_gb=None, snps_mem_gb=None):
+        gatk_path_override=None, indels_mem_gb=None, snps_mem_gb=None, resources=None,
+        available_cpu=None, available_mem_gb=None, vqsr_mode='auto', snps_model_mem_gb=None,
+        snp_downsample_factor=None, sites_only_vcf=None, targets=None, padding=100, plan=None, gatk_docker=None):
     """
     Create inputs for 'joint-discovery-gatk4-local' workflow
     :param directories:
@@ -293,6 +947,19 @@ def joint_discovery_inputs(
     :param callset_name:
     :param indels_mem_gb:
     :param snps_mem_gb:
+    :param resources: dict containing resources files previously collected by collect_resources_files
+    :param available_cpu: CPUs available to run workflow tasks, used to tune GenomicsDB import
+    :param available_mem_gb: memory in GB available to run workflow tasks, used to tune GenomicsDB import and VQSR
+    :param vqsr_mode: SNP VQSR mode: 'auto' (chosen by callset size), 'classic' or 'scattered'
+    :param snps_model_mem_gb: memory in GB of SNPsVariantRecalibratorCreateModel task
+    :param snp_downsample_factor: use one of every N SNP sites to build scattered VQSR model
+    :param sites_only_vcf: sites-only VCF of a previous callset used to count SNP sites instead of estimating them
+    :param targets: BED or interval list file with target intervals (exome or targeted sequencing)
+    :param padding: number of bases added to both sides of each target
+    :param plan: dict previously computed by plan_joint_discovery with the same resources, targets, padding
+    and sites-only VCF
+    :param gatk_docker: GATK docker image that runs the whole workflow instead of its default (GATK 4.1.0.0),
+    required to genotype reblocked gVCF files
     :return:
     """
 
@@ -311,8 +978,36 @@ def joint_discovery_inputs(
 
     inputs['JointGenotyping.callset_name'] = callset_name
 
-    inputs.update(collect_resources_files(
-        reference, 'joint-discovery', version))
+    if resources is None:
+        resources = collect_resources_files(reference, 'joint-discovery', version)
+    inputs.update(resources)
+
+    if plan is None:
+        plan = plan_joint_discovery(resources, targets, padding, sites_only_vcf)
+    inputs['JointGenotyping.unpadded_intervals_file'] = plan['unpadded_intervals_file']
+    snp_sites = plan['snp_sites']
+
+    gvcfs_size_gb = sum(getsize(file) for file in inputs['JointGenotyping.input_gvcfs']) / GIB
+    import_plan = plan_genomicsdb_import(
+        len(inputs['JointGenotyping.input_gvcfs']), gvcfs_size_gb, plan['num_intervals'], available_cpu,
+        available_mem_gb)
+    inputs['JointGenotyping.import_batch_size'] = import_plan['batch_size']
+    inputs['JointGenotyping.import_reader_threads'] = import_plan['reader_threads']
+    inputs['JointGenotyping.import_java_mem_gb'] = import_plan['java_mem_gb']
+    inputs['JointGenotyping.import_mem_gb'] = import_plan['mem_gb']
+    # padded targets (or groups of close targets) are imported one per shard
+    inputs['JointGenotyping.import_merge_count'] = 1 if targets else import_plan['merge_count']
+
+    if snp_sites is None:
+        snp_sites = estimate_snp_sites(len(inputs['JointGenotyping.input_gvcfs']), gvcfs_size_gb)
+    vqsr_plan = plan_vqsr(len(inputs['JointGenotyping.input_gvcfs']), snp_sites, vqsr_mode, available_mem_gb)
+    inputs['JointGenotyping.scatter_snps_vqsr'] = vqsr_plan['scattered']
+    if vqsr_plan['scattered']:
+        inputs['JointGenotyping.snps_model_mem_gb'] = snps_model_mem_gb or vqsr_plan['model_mem_gb']
+        inputs['JointGenotyping.SNP_VQSR_downsampleFactor'] = snp_downsample_factor or vqsr_plan['downsample_factor']
+    else:
+        inputs['JointGenotyping.snps_variant_recalibrator_mem_gb'] = vqsr_plan['snps_mem_gb']
+        inputs['JointGenotyping.snps_variant_recalibrator_java_mem_gb'] = vqsr_plan['snps_java_mem_gb']
 
     if gatk_path_override:
         if not isfile(gatk_path_override):
@@ -320,10 +1015,18 @@ def joint_discovery_inputs(
         inputs['JointGenotyping.gatk_path_override'] = abspath(
             gatk_path_override)
 
+    if gatk_docker:
+        inputs['JointGenotyping.gatk_docker_override'] = gatk_docker
+    elif any(is_reblocked(file) for file in inputs['JointGenotyping.input_gvcfs']):
+        raise Exception('Reblocked gVCF files can not be genotyped by default GATK of joint-discovery, '
+                        'set gatk_docker to the GATK docker image that wrote them')
+
     if indels_mem_gb:
         inputs['JointGenotyping.indels_variant_recalibrator_mem_gb'] = indels_mem_gb
     if snps_mem_gb:
+        # task default Java heap follows the memory set by the user
         inputs['JointGenotyping.snps_variant_recalibrator_mem_gb'] = snps_mem_gb
+        inputs.pop('JointGenotyping.snps_variant_recalibrator_java_mem_gb', None)
 
     return inputs
 
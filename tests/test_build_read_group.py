@@ -0,0 +1,16 @@
+from unittest import TestCase
+
+from espresso.fastq import build_read_group
+
+
+class TestBuildReadGroup(TestCase):
+
+    def test_build_read_group(self):
+        self.assertEqual('@RG\\tID:NA12878\\tSM:NA12878\\tLB:Lib1\\tPU:H0164ALXX140820.2.ACGT\\tDT:2019-05-10'
+                         '\\tPL:ILLUMINA\\tCN:MyCenter',
+                         build_read_group('NA12878', 'Lib1', 'H0164ALXX140820.2.ACGT', '2019-05-10',
+                                          'ILLUMINA', 'MyCenter'))
+
+    def test_invalid_value(self):
+        with self.assertRaises(Exception):
+            build_read_group('NA12878', 'Lib1', '-', '2019-05-10', 'ILLUMINA', 'My Center')
@@ -0,0 +1,33 @@
+from os import stat
+from os.path import join
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from espresso.workflows import called_gvcfs, stage_file
+
+
+class TestCalledGvcfs(TestCase):
+
+    def test_called_gvcfs(self):
+        metadata = {'calls': {
+            'HaplotypeCalling.HaplotypeCallerGvcf_GATK4': [
+                {'shardIndex': 0, 'executionStatus': 'Done',
+                 'outputs': {'output_vcf': '/exec/A.g.vcf.gz', 'output_vcf_index': '/exec/A.g.vcf.gz.tbi'}},
+                {'shardIndex': 1, 'executionStatus': 'Running', 'outputs': {}},
+                {'shardIndex': 2, 'executionStatus': 'Done',
+                 'outputs': {'HaplotypeCallerGvcf_GATK4.output_vcf': '/exec/C.rb.g.vcf.gz',
+                             'HaplotypeCallerGvcf_GATK4.output_vcf_index': '/exec/C.rb.g.vcf.gz.tbi'}}],
+            'HaplotypeCalling.BamToCram': [{'executionStatus': 'Running'}]}}
+        self.assertEqual([('/exec/A.g.vcf.gz', '/exec/A.g.vcf.gz.tbi'),
+                          ('/exec/C.rb.g.vcf.gz', '/exec/C.rb.g.vcf.gz.tbi')], called_gvcfs(metadata))
+        self.assertEqual([], called_gvcfs({}))
+
+    def test_stage_file(self):
+        file = join(mkdtemp(), 'A.g.vcf.gz')
+        with open(file, 'w') as f:
+            f.write('gvcf')
+        destination = mkdtemp()
+        staged_file = stage_file(file, destination)
+        self.assertEqual(join(destination, 'A.g.vcf.gz'), staged_file)
+        self.assertEqual(stat(file).st_ino, stat(staged_file).st_ino)
+        self.assertEqual(staged_file, stage_file(file, destination))
@@ -0,0 +1,36 @@
+from os.path import join
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from espresso.vcf import collect_vcf_files
+
+
+def touch(directory, *names):
+    for name in names:
+        open(join(directory, name), 'w').close()
+
+
+class TestCollectVcfFiles(TestCase):
+
+    def test_collect_vcf_files(self):
+        directory = mkdtemp()
+        touch(directory, 'A.b37.g.vcf.gz', 'A.b37.g.vcf.gz.tbi', 'B.b37.g.vcf.gz', 'B.b37.g.vcf.gz.tbi')
+        sample_names, vcf_files, index_files = collect_vcf_files(directory, 'batch1_')
+        self.assertEqual(['batch1_A', 'batch1_B'], sample_names)
+        self.assertEqual([join(directory, 'A.b37.g.vcf.gz'), join(directory, 'B.b37.g.vcf.gz')], vcf_files)
+        self.assertEqual([vcf + '.tbi' for vcf in vcf_files], index_files)
+
+    def test_collect_vcf_files_prefers_reblocked(self):
+        directory = mkdtemp()
+        touch(directory, 'A.b37.g.vcf.gz', 'A.b37.g.vcf.gz.tbi', 'A.b37.rb.g.vcf.gz', 'A.b37.rb.g.vcf.gz.tbi',
+              'B.b37.g.vcf.gz', 'B.b37.g.vcf.gz.tbi', 'C.rb.g.vcf.gz', 'C.rb.g.vcf.gz.tbi')
+        sample_names, vcf_files, index_files = collect_vcf_files(directory)
+        self.assertEqual(['A', 'B', 'C'], sample_names)
+        self.assertEqual([join(directory, 'A.b37.rb.g.vcf.gz'), join(directory, 'B.b37.g.vcf.gz'),
+                          join(directory, 'C.rb.g.vcf.gz')], vcf_files)
+        self.assertEqual([vcf + '.tbi' for vcf in vcf_files], index_files)
+
+    def test_collect_vcf_files_missing_index(self):
+        directory = mkdtemp()
+        touch(directory, 'A.rb.g.vcf.gz', 'B.g.vcf.gz', 'B.g.vcf.gz.tbi')
+        self.assertRaises(Exception, collect_vcf_files, directory)
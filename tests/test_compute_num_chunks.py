@@ -0,0 +1,19 @@
+from os.path import join
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from espresso.fastq import compute_num_chunks
+
+
+class TestComputeNumChunks(TestCase):
+
+    def test_compute_num_chunks(self):
+        temp_dir = mkdtemp()
+        files = [join(temp_dir, 'sample_R1.fastq.gz'), join(temp_dir, 'sample_R2.fastq.gz')]
+        for file in files:
+            with open(file, 'wb') as f:
+                f.write(b'\0' * 1024 ** 2)
+        self.assertEqual(1, compute_num_chunks(files, 1))
+        self.assertEqual(2, compute_num_chunks(files, 1 / 1024))
+        self.assertEqual(4, compute_num_chunks(files, 0.5 / 1024))
+        self.assertRaises(Exception, compute_num_chunks, files, 0)
@@ -0,0 +1,21 @@
+from unittest import TestCase
+
+from espresso.workflows import count_cache_hits
+
+METADATA = {
+    'calls': {
+        'HaplotypeCalling.ValidateBamsWf': [{
+            'subWorkflowMetadata': {
+                'calls': {
+                    'ValidateBamsWf.ValidateBAM': [
+                        {'shardIndex': 0, 'callCaching': {'hit': True}},
+                        {'shardIndex': 1, 'callCaching': {'hit': False}}]}}}],
+        'HaplotypeCalling.BamToCram': [{'shardIndex': -1, 'callCaching': {'hit': True}}],
+        'HaplotypeCalling.NoCaching': [{'shardIndex': -1}]}}
+
+
+class TestCountCacheHits(TestCase):
+
+    def test_count_cache_hits(self):
+        self.assertEqual((2, 3), count_cache_hits(METADATA))
+        self.assertEqual((0, 0), count_cache_hits({}))
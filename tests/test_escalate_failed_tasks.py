@@ -0,0 +1,52 @@
+from unittest import TestCase
+
+from espresso.memory import escalate_failed_tasks, escalate_memory
+
+METADATA = {
+    'calls': {
+        'HaplotypeCalling.PreProcessingForVariantDiscovery_GATK4': [{
+            'subWorkflowMetadata': {
+                'calls': {
+                    'PreProcessingForVariantDiscovery_GATK4.MarkDuplicates': [
+                        {'executionStatus': 'Failed', 'returnCode': 137}],
+                    'PreProcessingForVariantDiscovery_GATK4.SortAndFixTags': [
+                        {'executionStatus': 'Failed', 'returnCode': 1,
+                         'failures': [{'message': 'Job failed', 'causedBy': [
+                             {'message': 'java.lang.OutOfMemoryError: Java heap space', 'causedBy': []}]}]}],
+                    'PreProcessingForVariantDiscovery_GATK4.ApplyBQSR': [
+                        {'executionStatus': 'Failed', 'returnCode': 2,
+                         'failures': [{'message': 'File not found', 'causedBy': []}]}]}}}],
+        'HaplotypeCalling.HaplotypeCallerGvcf_GATK4': [{
+            'subWorkflowMetadata': {
+                'calls': {
+                    'HaplotypeCallerGvcf_GATK4.HaplotypeCaller': [
+                        {'shardIndex': 0, 'executionStatus': 'Failed', 'returnCode': 137},
+                        {'shardIndex': 1, 'executionStatus': 'Failed', 'returnCode': 137}]}}}]}}
+
+
+class TestEscalateFailedTasks(TestCase):
+
+    def test_escalate_failed_tasks(self):
+        inputs = {'HaplotypeCalling.sort_mem_gb': 20}
+        escalations = escalate_failed_tasks(METADATA, inputs, 28)
+        self.assertEqual(3, len(escalations))
+        self.assertEqual(11.25, inputs['HaplotypeCalling.mark_duplicates_mem_gb'])
+        self.assertEqual(28, inputs['HaplotypeCalling.sort_mem_gb'])
+        self.assertEqual(11, inputs['HaplotypeCalling.haplotype_caller_mem_gb'])
+        self.assertNotIn('HaplotypeCalling.aplly_bqsr_mem_gb', inputs)
+
+    def test_escalate_failed_tasks_ceiling(self):
+        inputs = {'HaplotypeCalling.mark_duplicates_mem_gb': 16,
+                  'HaplotypeCalling.sort_mem_gb': 16,
+                  'HaplotypeCalling.haplotype_caller_mem_gb': 16}
+        self.assertEqual([], escalate_failed_tasks(METADATA, inputs, 16))
+
+    def test_escalate_memory_java_heap(self):
+        inputs = {'JointGenotyping.import_java_mem_gb': 8, 'JointGenotyping.import_mem_gb': 11}
+        self.assertEqual(('JointGenotyping.import_mem_gb', 11, 17), escalate_memory(inputs, 'ImportGVCFs', 32))
+        self.assertEqual(12, inputs['JointGenotyping.import_java_mem_gb'])
+
+        inputs = {}
+        escalate_memory(inputs, 'ImportGVCFs', 32)
+        self.assertEqual(11, inputs['JointGenotyping.import_mem_gb'])
+        self.assertEqual(6, inputs['JointGenotyping.import_java_mem_gb'])
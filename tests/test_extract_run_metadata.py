@@ -0,0 +1,28 @@
+from os import mkdir
+from os.path import join
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from espresso.ingest import extract_run_metadata
+
+
+class TestExtractRunMetadata(TestCase):
+
+    def test_extract_run_metadata_from_name(self):
+        run_directory = join(mkdtemp(), '190710_M00123_0042_000000000-ABCDE')
+        mkdir(run_directory)
+        self.assertEqual(('190710_M00123_0042_000000000-ABCDE', '2019-07-10'), extract_run_metadata(run_directory))
+
+        run_directory = join(mkdtemp(), 'Batch1_20190710')
+        mkdir(run_directory)
+        self.assertEqual(('Batch1', '2019-07-10'), extract_run_metadata(
+            run_directory, '^(?P<library>.+)_(?P<date>\\d{8})$'))
+
+    def test_extract_run_metadata_from_sample_sheet(self):
+        run_directory = join(mkdtemp(), 'run1')
+        mkdir(run_directory)
+        self.assertRaises(Exception, extract_run_metadata, run_directory)
+
+        with open(join(run_directory, 'SampleSheet.csv'), 'w') as file:
+            file.write('[Header]\nIEMFileVersion,4\nExperiment Name,Batch2\nDate,2/7/2019\n\n[Data]\nSample_ID\n')
+        self.assertEqual(('Batch2', '2019-02-07'), extract_run_metadata(run_directory))
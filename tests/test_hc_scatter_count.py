@@ -0,0 +1,12 @@
+from unittest import TestCase
+
+from espresso.tuning import hc_scatter_count, HC_MAX_SHARDS
+
+
+class TestHcScatterCount(TestCase):
+
+    def test_hc_scatter_count(self):
+        self.assertEqual(32, hc_scatter_count(1, available_cpu=32))
+        self.assertEqual(11, hc_scatter_count(3, available_cpu=32))
+        self.assertEqual(1, hc_scatter_count(64, available_cpu=32))
+        self.assertEqual(HC_MAX_SHARDS, hc_scatter_count(1, available_cpu=HC_MAX_SHARDS * 4))
@@ -0,0 +1,65 @@
+from os.path import join
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from espresso.intervals import read_intervals, pad_intervals, split_intervals
+
+SEQUENCES = [('1', 10000), ('2', 5000)]
+
+
+class TestPadIntervals(TestCase):
+
+    def test_read_intervals(self):
+        bed_file = join(mkdtemp(), 'targets.bed')
+        with open(bed_file, 'w') as file:
+            file.write('track name=targets\n1\t99\t200\n2\t0\t50\n')
+        self.assertEqual([('1', 100, 200), ('2', 1, 50)], read_intervals(bed_file))
+
+    def test_pad_intervals(self):
+        intervals = [('2', 100, 200), ('1', 1000, 1100), ('1', 1250, 1300), ('1', 9950, 10000)]
+        self.assertEqual([('1', 900, 1400), ('1', 9850, 10000), ('2', 1, 300)],
+                         pad_intervals(intervals, 100, SEQUENCES))
+
+    def test_unknown_contig(self):
+        with self.assertRaises(Exception):
+            pad_intervals([('chr1', 100, 200)], 100, SEQUENCES)
+
+    def test_split_intervals(self):
+        intervals = [('1', 1, 1000), ('1', 2001, 2100), ('1', 3001, 3100), ('2', 1, 900), ('2', 1001, 1100)]
+        shards = split_intervals(intervals, 2)
+        self.assertEqual(2, len(shards))
+        self.assertEqual(intervals, shards[0] + shards[1])
+
+    def test_split_large_intervals(self):
+        intervals = [('1', 1, 1000), ('1', 2001, 2100), ('2', 1, 100)]
+        self.assertEqual([[('1', 1, 300)], [('1', 301, 600)], [('1', 601, 900)],
+                          [('1', 901, 1000), ('1', 2001, 2100), ('2', 1, 100)]], split_intervals(intervals, 4))
+        self.assertEqual([[('1', 1, 250)], [('1', 251, 500)], [('1', 501, 750)], [('1', 751, 1000)]],
+                         split_intervals(intervals[:1], 4))
+
+    def test_split_tiny_intervals(self):
+        intervals = [('1', 1, 1), ('1', 11, 12), ('1', 21, 22)]
+        shards = split_intervals(intervals, 8)
+        self.assertEqual(5, len(shards))
+        for shard in shards:
+            self.assertTrue(shard)
+            self.assertTrue(all(start <= end for contig, start, end in shard))
+        self.assertEqual([('1', 1, 1), ('1', 11, 11), ('1', 12, 12), ('1', 21, 21), ('1', 22, 22)],
+                         [interval for shard in shards for interval in shard])
+
+    def test_split_more_shards_than_intervals(self):
+        intervals = [('1', 1, 100), ('2', 1, 100)]
+        shards = split_intervals(intervals, 50)
+        self.assertEqual(50, len(shards))
+        self.assertEqual(200, sum(end - start + 1 for shard in shards for contig, start, end in shard))
+        self.assertTrue(all(end - start + 1 == 4 for shard in shards for contig, start, end in shard))
+
+    def test_split_rounding_at_shard_boundaries(self):
+        intervals = [('1', 1, 10), ('1', 21, 23), ('1', 31, 40)]
+        for num_shards in range(1, 30):
+            shards = split_intervals(intervals, num_shards)
+            pieces = [interval for shard in shards for interval in shard]
+            self.assertTrue(all(shards))
+            self.assertLessEqual(len(shards), num_shards)
+            self.assertTrue(all(start <= end for contig, start, end in pieces))
+            self.assertEqual(23, sum(end - start + 1 for contig, start, end in pieces))
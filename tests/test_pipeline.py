@@ -0,0 +1,23 @@
+from os.path import isfile, join
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from espresso.api import Pipeline, WorkflowFiles
+
+
+class TestPipeline(TestCase):
+
+    def test_prepare(self):
+        destination = join(mkdtemp(), 'batch1')
+        pipeline = Pipeline(genome_version='b37')
+        files = pipeline.prepare('joint-discovery', {'JointGenotyping.callset_name': 'cs'}, destination)
+
+        self.assertIsInstance(files, WorkflowFiles)
+        self.assertEqual(destination, files.destination)
+        self.assertIsNone(files.imports_file)
+        self.assertEqual(join(destination, 'joint-discovery.b37.inputs.json'), files.inputs_file)
+        for file in [files.workflow_file, files.inputs_file, files.options_file, files.labels_file]:
+            self.assertTrue(isfile(file), 'file not found {}'.format(file))
+
+        found_files = pipeline.find('joint-discovery', destination)
+        self.assertEqual(files, found_files)
@@ -0,0 +1,27 @@
+from unittest import TestCase
+
+from espresso.tuning import plan_genomicsdb_import
+
+
+class TestPlanGenomicsdbImport(TestCase):
+
+    def test_plan_genomicsdb_import_small_cohort(self):
+        plan = plan_genomicsdb_import(20, 2, 4000, available_cpu=16, available_mem_gb=64)
+        self.assertEqual(20, plan['batch_size'])
+        self.assertEqual(5, plan['reader_threads'])
+        # three imports fit in the host at the same time, two shards each
+        self.assertEqual(4000 // 6, plan['merge_count'])
+
+    def test_plan_genomicsdb_import_large_cohort(self):
+        plan = plan_genomicsdb_import(3000, 18000, 4000, available_cpu=64, available_mem_gb=256)
+        self.assertEqual(50, plan['batch_size'])
+        self.assertEqual(4, plan['java_mem_gb'])
+        self.assertEqual(7, plan['mem_gb'])
+        self.assertEqual(1, plan['merge_count'])
+
+    def test_plan_genomicsdb_import_limited_host(self):
+        plan = plan_genomicsdb_import(200, 100, 4000, available_cpu=2, available_mem_gb=4)
+        self.assertLessEqual(plan['mem_gb'], 4)
+        self.assertEqual(2, plan['reader_threads'])
+        self.assertEqual(4000 // 50, plan['merge_count'])
+        self.assertRaises(Exception, plan_genomicsdb_import, 0, 0, 4000)
@@ -0,0 +1,44 @@
+from os.path import join
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from espresso.tuning import plan_vqsr, estimate_snp_sites, count_snp_sites
+
+
+class TestPlanVqsr(TestCase):
+
+    def test_estimate_snp_sites(self):
+        self.assertEqual(3600000, estimate_snp_sites(1, 6))
+        self.assertGreater(estimate_snp_sites(100, 600), estimate_snp_sites(10, 60))
+        self.assertLess(estimate_snp_sites(100, 600), 10 * estimate_snp_sites(10, 60))
+
+    def test_count_snp_sites(self):
+        vcf_file = join(mkdtemp(), 'sites.vcf')
+        with open(vcf_file, 'w') as file:
+            file.write('##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\n'
+                       '1\t10\t.\tA\tG\n1\t20\t.\tAT\tA\n1\t30\t.\tC\tT,G\n')
+        self.assertEqual(2, count_snp_sites(vcf_file))
+
+    def test_plan_vqsr(self):
+        plan = plan_vqsr(30, 16000000, available_mem_gb=128)
+        self.assertFalse(plan['scattered'])
+        self.assertEqual(10, plan['snps_java_mem_gb'])
+        self.assertEqual(12, plan['snps_mem_gb'])
+
+        plan = plan_vqsr(12000, 40000000, available_mem_gb=128)
+        self.assertTrue(plan['scattered'])
+        self.assertEqual(4, plan['downsample_factor'])
+        self.assertLess(plan['model_mem_gb'], 104)
+
+        plan = plan_vqsr(30, 16000000, available_mem_gb=8)
+        self.assertTrue(plan['scattered'])
+        self.assertLessEqual(plan['model_mem_gb'], 8)
+
+        plan = plan_vqsr(30, 16000000, 'classic', 6)
+        self.assertFalse(plan['scattered'])
+        self.assertEqual(2, plan['downsample_factor'])
+        self.assertRaises(Exception, plan_vqsr, 30, 16000000, 'auto', 6)
+        self.assertRaises(Exception, plan_vqsr, 30, 16000000, 'scattered', 4)
+
+        self.assertFalse(plan_vqsr(12000, 40000000, 'classic', 128)['scattered'])
+        self.assertRaises(Exception, plan_vqsr, 30, 16000000, 'fast')
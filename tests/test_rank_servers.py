@@ -0,0 +1,59 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from json import dumps
+from threading import Thread
+from unittest import TestCase
+
+from espresso.servers import rank_servers, submit_failover, collect_hosts
+
+UNREACHABLE_HOST = 'http://127.0.0.1:9'
+
+
+def start_server(active_workflows):
+    """Start a stand-in Cromwell server that answers workflow queries with a number of active workflows"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = dumps(dict(results=[], totalResultsCount=active_workflows)).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:{}'.format(server.server_port)
+
+
+class TestRankServers(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.busy_server, cls.busy_host = start_server(5)
+        cls.idle_server, cls.idle_host = start_server(1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.busy_server.shutdown()
+        cls.idle_server.shutdown()
+
+    def test_rank_servers(self):
+        hosts = [UNREACHABLE_HOST, self.busy_host, self.idle_host]
+        self.assertEqual([self.idle_host, self.busy_host, UNREACHABLE_HOST], rank_servers(hosts))
+
+    def test_submit_failover(self):
+        import requests
+
+        def submit(host):
+            return requests.get(host + '/api/workflows/v1/query', timeout=5).json()['totalResultsCount']
+
+        self.assertEqual((self.busy_host, 5), submit_failover([UNREACHABLE_HOST, self.busy_host], submit))
+        with self.assertRaises(requests.ConnectionError):
+            submit_failover([UNREACHABLE_HOST], submit)
+
+    def test_collect_hosts(self):
+        self.assertEqual(['http://a:8000', 'http://b:8000'],
+                         collect_hosts(['http://a:8000/', 'http://b:8000', 'http://a:8000']))
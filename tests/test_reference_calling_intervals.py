@@ -0,0 +1,50 @@
+from os import environ
+from os.path import join
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest.mock import patch
+
+from espresso.intervals import reference_calling_intervals, scatter_reference, read_intervals
+
+SEQUENCES = [
+    ('1', 'ACGT' * 250 + 'N' * 600 + 'acgt' * 100 + 'NNN' + 'ACGT' * 150 + 'N' * 500),
+    ('2', 'N' * 700 + 'ACGT' * 300),
+    ('GL000192.1', 'ACGT' * 100)]
+
+
+def write_reference(directory, line_bases=60):
+    fasta_file = join(directory, 'ref.fasta')
+    with open(fasta_file, 'w') as fasta, open(fasta_file + '.fai', 'w') as fai, \
+            open(join(directory, 'ref.dict'), 'w') as dict_file:
+        dict_file.write('@HD\tVN:1.5\n')
+        for name, sequence in SEQUENCES:
+            fasta.write('>' + name + '\n')
+            fai.write('{}\t{}\t{}\t{}\t{}\n'.format(name, len(sequence), fasta.tell(), line_bases, line_bases + 1))
+            for idx in range(0, len(sequence), line_bases):
+                fasta.write(sequence[idx:idx + line_bases] + '\n')
+            dict_file.write('@SQ\tSN:{}\tLN:{}\n'.format(name, len(sequence)))
+    return fasta_file, fasta_file + '.fai', join(directory, 'ref.dict')
+
+
+class TestReferenceCallingIntervals(TestCase):
+
+    def test_reference_calling_intervals(self):
+        fasta_file, fai_file, dict_file = write_reference(mkdtemp())
+        self.assertEqual([('1', 1, 1000), ('1', 1601, 2603), ('2', 701, 1900)],
+                         reference_calling_intervals(fasta_file, fai_file))
+
+    def test_reference_calling_intervals_block_boundaries(self):
+        fasta_file, fai_file, dict_file = write_reference(mkdtemp(), line_bases=7)
+        with patch('espresso.intervals.FASTA_BLOCK_SIZE', 16):
+            self.assertEqual([('1', 1, 1000), ('1', 1601, 2603), ('2', 701, 1900)],
+                             reference_calling_intervals(fasta_file, fai_file))
+
+    def test_scatter_reference(self):
+        fasta_file, fai_file, dict_file = write_reference(mkdtemp())
+        with patch.dict(environ, {'ESPRESSO_CACHE_DIR': mkdtemp()}):
+            list_file = scatter_reference(fasta_file, fai_file, dict_file, 2)
+            self.assertEqual(list_file, scatter_reference(fasta_file, fai_file, dict_file, 2))
+            with open(list_file) as file:
+                interval_files = file.read().split()
+            self.assertEqual([[('1', 1, 1000), ('1', 1601, 2603)], [('2', 701, 1900)]],
+                             [read_intervals(interval_file) for interval_file in interval_files])
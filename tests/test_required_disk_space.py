@@ -0,0 +1,32 @@
+from unittest import TestCase
+
+from espresso.disk import plan_haplotype_calling_disk, plan_joint_discovery_disk, required_disk_space
+
+
+class TestRequiredDiskSpace(TestCase):
+
+    def test_plan_haplotype_calling_disk(self):
+        plan = plan_haplotype_calling_disk(100)
+        self.assertAlmostEqual(1030, plan['peak_gb'])
+        self.assertAlmostEqual(220, plan['outputs_gb'])
+        self.assertAlmostEqual(10, plan['gvcfs_gb'])
+
+        plan = plan_haplotype_calling_disk(100, spark_mark_duplicates=True)
+        self.assertAlmostEqual(890, plan['peak_gb'])
+        self.assertIn('MarkDuplicatesSpark', [stage for stage, size_gb in plan['stages']])
+
+    def test_required_disk_space(self):
+        plans = [plan_haplotype_calling_disk(100), plan_joint_discovery_disk(10)]
+
+        scratch_gb, destination_gb, combined_gb = required_disk_space(plans)
+        self.assertAlmostEqual(1057, scratch_gb)
+        self.assertAlmostEqual(223, destination_gb)
+        self.assertAlmostEqual(1280, combined_gb)
+
+        scratch_gb, destination_gb, combined_gb = required_disk_space(plans, delete_intermediates=True)
+        self.assertAlmostEqual(1030, scratch_gb)
+        self.assertAlmostEqual(223, destination_gb)
+
+        scratch_gb, destination_gb, combined_gb = required_disk_space(plans, move=True, delete_intermediates=True)
+        self.assertAlmostEqual(1030, scratch_gb)
+        self.assertAlmostEqual(1030, combined_gb)
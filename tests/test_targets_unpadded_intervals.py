@@ -0,0 +1,32 @@
+from os import environ
+from os.path import join
+from tempfile import mkdtemp
+from unittest import TestCase
+from unittest.mock import patch
+
+from espresso.intervals import targets_unpadded_intervals, group_intervals
+
+
+class TestTargetsUnpaddedIntervals(TestCase):
+
+    def test_targets_unpadded_intervals(self):
+        directory = mkdtemp()
+        dict_file = join(directory, 'ref.dict')
+        with open(dict_file, 'w') as file:
+            file.write('@HD\tVN:1.5\n@SQ\tSN:1\tLN:100000\n@SQ\tSN:2\tLN:50000\n')
+        targets_file = join(directory, 'targets.bed')
+        with open(targets_file, 'w') as file:
+            file.write('1\t999\t1100\n1\t1150\t1200\n1\t50000\t50100\n2\t20000\t20100\n')
+
+        with patch.dict(environ, {'ESPRESSO_CACHE_DIR': mkdtemp()}):
+            with open(targets_unpadded_intervals(targets_file, 100, dict_file)) as file:
+                self.assertEqual(['1:900-1300', '1:49901-50200', '2:19901-20200'], file.read().split())
+
+            with open(targets_unpadded_intervals(targets_file, 100, dict_file, max_intervals=1)) as file:
+                self.assertEqual(['1:900-50200', '2:19901-20200'], file.read().split())
+
+    def test_group_intervals(self):
+        intervals = [('1', 1, 10), ('1', 21, 30), ('1', 1031, 1040), ('1', 1061, 1070), ('2', 1, 10)]
+        self.assertEqual(intervals, group_intervals(intervals, 5))
+        self.assertEqual([('1', 1, 30), ('1', 1031, 1070), ('2', 1, 10)], group_intervals(intervals, 3))
+        self.assertEqual([('1', 1, 1070), ('2', 1, 10)], group_intervals(intervals, 1))
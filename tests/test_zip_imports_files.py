@@ -1,12 +1,29 @@
+from os import environ, stat
 from os.path import isfile
 from unittest import TestCase
+from unittest.mock import patch
 from tempfile import mkdtemp
-from espresso.workflows import zip_imports_files
+from zipfile import ZipFile
+from espresso.workflows import zip_imports_files, bundle_imports_files, IMPORTS_FILES
 
 
 class TestZipImportsFiles(TestCase):
 
     def test_zip_imports_files(self):
-        temp_dir = mkdtemp()
-        zip_file = zip_imports_files('haplotype-calling', temp_dir)
-        self.assertTrue(isfile(zip_file))
+        with patch.dict(environ, {'ESPRESSO_CACHE_DIR': mkdtemp()}):
+            temp_dir = mkdtemp()
+            zip_file = zip_imports_files('haplotype-calling', temp_dir)
+            self.assertTrue(isfile(zip_file))
+
+    def test_zip_imports_files_reuses_bundle(self):
+        with patch.dict(environ, {'ESPRESSO_CACHE_DIR': mkdtemp()}):
+            bundle_file = bundle_imports_files('haplotype-calling')
+            self.assertEqual(bundle_file, bundle_imports_files('haplotype-calling'))
+
+            temp_dir = mkdtemp()
+            zip_file = zip_imports_files('haplotype-calling', temp_dir)
+            self.assertEqual(zip_file, zip_imports_files('haplotype-calling', temp_dir))
+            self.assertEqual(stat(bundle_file).st_ino, stat(zip_file).st_ino)
+
+        with ZipFile(zip_file) as file:
+            self.assertEqual(len(IMPORTS_FILES.get('haplotype-calling')), len(file.namelist()))